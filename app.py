@@ -1,25 +1,46 @@
-import difflib
+import atexit
+import click
 import hashlib
 import hashtag
 import hmac
+import html
 import json
 import os
 import re
-import requests
 import sqlite3
-import urllib
+import time
 
+from assets import build_assets, load_manifest, send_asset
 from bs4 import BeautifulSoup
-from datetime import datetime, timedelta
+from catalog import CatalogWriter, backfill_tags, count_stale_tags, dedupe_catalog, ensure_tag_columns, memo_tag, retag_catalog
+from catalog import migrate_catalog
+from cities import city_index
+from datetime import datetime
 from dotenv import load_dotenv
+from enrichment import BackgroundEnricher
+from http_client import HttpClient
+from message import MessageBuilder
+from metrics import RANKING_SECONDS, TAGGING_SECONDS, flight_observer, instrument_app, instrument_engine, query_observer
+from metrics import upstream_observer
+from metrics import render as render_metrics
+from outbox import Outbox
+from profiler import PROFILE_FLAG, RequestProfiler
+from fragments import FragmentCache
 from forms import AuctionForm, AuctionItemForm, BoardGameForm, BoardGameItemForm
-from flask import Flask, flash, render_template, redirect, jsonify, url_for
+from flask import Flask, Response, flash, render_template, redirect, jsonify, session, url_for
 from flask.globals import request
 from flask_cors import CORS, cross_origin
 from flask_sqlalchemy import SQLAlchemy
+from markupsafe import Markup
+from ranking import rank
+from search import FTS_SEARCH_SQL, SearchCache, TrigramIndex, fold, fts_exists, fts_match_expression, needs_like_fallback, rebuild_fts
+from singleflight import SingleFlight
+from snapshot import CatalogSnapshot, build_snapshot
+from users import BRASILIA_TIMEZONE, UsersRepository, migrate_users
 
 app = Flask(__name__)
 cors = CORS(app)
+instrument_app(app)
 
 env_path = os.path.join(os.getcwd(), '.env')
 
@@ -28,21 +49,273 @@ if os.path.exists(env_path):
 
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
+TELEGRAM_SECRET_KEY = hashlib.sha256(TELEGRAM_TOKEN.encode()).digest() if TELEGRAM_TOKEN else None
+SESSION_TTL = int(os.getenv('SESSION_TTL', 600))
 USERS_DB_NAME = os.getenv('USERS_DB_NAME')
+USERS_DB_BUSY_TIMEOUT = float(os.getenv('USERS_DB_BUSY_TIMEOUT', 5.0))
+USERS_COOLDOWN_CACHE_TTL = int(os.getenv('USERS_COOLDOWN_CACHE_TTL', 300))
+POST_COOLDOWN = 168 * 3600
+NAMES_DB_NAME = os.getenv('NAMES_DB_NAME', 'names.db')
+OUTBOX_DB_NAME = os.getenv('OUTBOX_DB_NAME', 'outbox.db')
+OUTBOX_CHAT_INTERVAL = float(os.getenv('OUTBOX_CHAT_INTERVAL', 3.0))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
 BGB_BAZAR_CHANNEL_ID = os.getenv('BGB_BAZAR_CHANNEL_ID')
 BGB_TESTES_CHANNEL_ID = os.getenv('BGB_TESTES_CHANNEL_ID')
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'trigram')
+CATALOG_SNAPSHOT = os.getenv('CATALOG_SNAPSHOT', f'{NAMES_DB_NAME}.snapshot')
+CATALOG_SNAPSHOT_CHECK_INTERVAL = float(os.getenv('CATALOG_SNAPSHOT_CHECK_INTERVAL', 1.0))
+CATALOG_INDEX_CHECK_INTERVAL = float(os.getenv('CATALOG_INDEX_CHECK_INTERVAL', 1.0))
+RANKING_MODE = os.getenv('RANKING_MODE', 'difflib')
+BGSEARCH_CACHE_SIZE = int(os.getenv('BGSEARCH_CACHE_SIZE', 1024))
+BGSEARCH_CACHE_TTL = int(os.getenv('BGSEARCH_CACHE_TTL', 300))
+BGG_WORKERS = int(os.getenv('BGG_WORKERS', 2))
+BGG_QUEUE_SIZE = int(os.getenv('BGG_QUEUE_SIZE', 32))
+BGG_NEGATIVE_TTL = int(os.getenv('BGG_NEGATIVE_TTL', 3600))
+BGSEARCH_FLIGHT_TIMEOUT = float(os.getenv('BGSEARCH_FLIGHT_TIMEOUT', 2.0))
+BGG_FLIGHT_TIMEOUT = float(os.getenv('BGG_FLIGHT_TIMEOUT', 15.0))
+BGG_INLINE_TIMEOUT = float(os.getenv('BGG_INLINE_TIMEOUT', 0))
+CATALOG_BATCH_SIZE = int(os.getenv('CATALOG_BATCH_SIZE', 50))
+CATALOG_FLUSH_INTERVAL = float(os.getenv('CATALOG_FLUSH_INTERVAL', 1.0))
+BGG_API_URL = os.getenv('BGG_API_URL', 'https://www.boardgamegeek.com')
+COMPARAJOGOS_API_URL = os.getenv('COMPARAJOGOS_API_URL', 'https://btr620i3rc.execute-api.sa-east-1.amazonaws.com/')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+PROFILE_DIR = os.getenv('PROFILE_DIR')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 200))
 
 app.config['CORS_HEADERS'] = 'Content-Type'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///names.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{NAMES_DB_NAME}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
 db.init_app(app)
 
+profiler = None
+
+if PROFILE_DIR:
+    profiler = RequestProfiler(PROFILE_DIR, app.config['SECRET_KEY'], sample_rate=PROFILE_SAMPLE_RATE,
+                               interval=PROFILE_INTERVAL, keep=PROFILE_KEEP)
+    profiler.init_app(app)
+
+http = HttpClient(
+    connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05)),
+    read_timeout=float(os.getenv('HTTP_READ_TIMEOUT', 10)),
+    retries=int(os.getenv('HTTP_RETRIES', 2)),
+    failure_threshold=int(os.getenv('HTTP_CIRCUIT_FAILURES', 5)),
+    reset_timeout=float(os.getenv('HTTP_CIRCUIT_RESET', 30)),
+    on_request=upstream_observer({
+        'bgg'           : BGG_API_URL,
+        'comparajogos'  : COMPARAJOGOS_API_URL,
+        'telegram'      : TELEGRAM_API_URL,
+    }),
+)
+
+outbox = Outbox(OUTBOX_DB_NAME, f'{TELEGRAM_API_URL}/bot{TELEGRAM_TOKEN}/sendMessage', http,
+                chat_interval=OUTBOX_CHAT_INTERVAL, max_attempts=OUTBOX_MAX_ATTEMPTS)
+
+users = UsersRepository(USERS_DB_NAME, busy_timeout=USERS_DB_BUSY_TIMEOUT, cache_ttl=USERS_COOLDOWN_CACHE_TTL,
+                        on_query=query_observer('users'))
+users.migrate()
+
 class Names(db.Model):
     __tablename__ = "boardgames"
+    __table_args__ = (db.Index('ix_boardgames_name', 'name', unique=True),)
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     name = db.Column(db.String)
+    tag = db.Column(db.String)
+    tag_version = db.Column(db.String)
+
+
+ASSETS_DIR = os.path.join(app.static_folder, 'dist')
+
+try:
+    asset_manifest = build_assets(app.static_folder, ASSETS_DIR)
+
+except OSError:
+    asset_manifest = load_manifest(ASSETS_DIR) or {}
+
+FORMS_TEMPLATES = [
+    'addons/forms.html',
+    'addons/boardgame_section.html',
+    'addons/boardgame_confirmation.html',
+    'addons/auction_section.html',
+    'addons/auction_confirmation.html',
+    'macros/subforms.html',
+]
+TEMPLATE_FORMS_TEMPLATES = [
+    'addons/template_forms.html',
+    'macros/subforms.html',
+]
+
+fragment_cache = FragmentCache()
+
+search_cache = SearchCache(maxsize=BGSEARCH_CACHE_SIZE, ttl=BGSEARCH_CACHE_TTL, narrowing=SEARCH_BACKEND != 'fts5')
+catalog_index = TrigramIndex(check_interval=CATALOG_INDEX_CHECK_INTERVAL, on_refresh=search_cache.clear)
+catalog_snapshot = CatalogSnapshot(CATALOG_SNAPSHOT, check_interval=CATALOG_SNAPSHOT_CHECK_INTERVAL,
+                                   on_swap=search_cache.clear)
+search_flight = SingleFlight(timeout=BGSEARCH_FLIGHT_TIMEOUT, on_call=flight_observer('bgsearch'))
+bgg_flight = SingleFlight(timeout=BGG_FLIGHT_TIMEOUT, on_call=flight_observer('bgg'))
+
+with app.app_context():
+    instrument_engine(db.engine, 'names')
+
+    con = db.engine.raw_connection()
+    migrate_catalog(con.connection)
+    ensure_tag_columns(con)
+    con.close()
+
+    if SEARCH_BACKEND == 'trigram':
+        catalog_index.load(db.session.query(Names.id, Names.name).all())
+
+    elif SEARCH_BACKEND == 'snapshot':
+        con = db.engine.raw_connection()
+        catalog_snapshot.open(con)
+        con.close()
+
+    elif SEARCH_BACKEND == 'fts5':
+        con = db.engine.raw_connection()
+
+        if not fts_exists(con):
+            rebuild_fts(con)
+
+        con.close()
+
+
+@app.cli.command('rebuild-fts')
+def rebuild_fts_command():
+    """
+    Creates (or recreates) the FTS5 mirror of the boardgames table.
+    """
+    con = db.engine.raw_connection()
+    rebuild_fts(con)
+    con.close()
+
+    print('boardgames_fts rebuilt.')
+
+
+@app.cli.command('build-snapshot')
+def build_snapshot_command():
+    """
+    Writes the memory-mapped catalog snapshot read by the snapshot search
+    backend.
+    """
+    con = db.engine.raw_connection()
+    count, max_id = build_snapshot(con, CATALOG_SNAPSHOT)
+    con.close()
+
+    print(f'{count} boardgames written to {CATALOG_SNAPSHOT}.')
+
+
+@app.cli.command('dedupe-catalog')
+def dedupe_catalog_command():
+    """
+    Removes duplicated boardgames, adds the unique index on their names and
+    runs VACUUM and ANALYZE on names.db. The app does it on startup when the
+    index is missing; the command runs it again anyway.
+    """
+    con = db.engine.raw_connection()
+    deleted = dedupe_catalog(con.connection)
+    con.close()
+
+    print(f'{deleted} duplicated boardgames removed.')
+
+
+@app.cli.command('backfill-tags')
+@click.option('--all', 'force', is_flag=True, help='Re-tag every boardgame, not only the stale ones.')
+def backfill_tags_command(force):
+    """
+    Stores the hashtag of every boardgame whose tag is missing or was
+    generated by an older version of the rules in hashtag.py.
+    """
+    con = db.engine.raw_connection()
+    print(f'{count_stale_tags(con)} stale tags (rules version {hashtag.RULES_VERSION}).')
+    tagged = backfill_tags(con, force=force)
+    con.close()
+
+    print(f'{tagged} boardgames tagged.')
+
+
+@app.cli.command('retag')
+@click.option('--workers', type=int, default=None, help='Worker processes, defaults to the number of cores.')
+@click.option('--chunk-size', type=int, default=2000, help='Rows tagged and written per chunk.')
+@click.option('--report', type=click.File('w'), default=None, help='CSV file listing the tags that changed.')
+def retag_command(workers, chunk_size, report):
+    """
+    Re-tags the whole catalog in parallel, to be run after changing the
+    rules in hashtag.py.
+    """
+    con = db.engine.raw_connection()
+    tagged, changed = retag_catalog(con.connection, workers=workers, chunk_size=chunk_size, report=report)
+    con.close()
+
+    print(f'{tagged} boardgames tagged, {changed} tags changed.')
+
+
+@app.cli.command('migrate-users')
+@click.argument('path', required=False, type=click.Path(exists=True, dir_okay=False))
+def migrate_users_command(path):
+    """
+    Converts the cooldown dates of a users.db to epoch seconds and adds its
+    indexes. Defaults to USERS_DB_NAME.
+    """
+    con = sqlite3.connect(path or USERS_DB_NAME)
+    converted = migrate_users(con)
+    con.close()
+
+    print(f'{converted} users converted.')
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """
+    Writes the fingerprinted and precompressed static assets.
+    """
+    manifest = build_assets(app.static_folder, ASSETS_DIR)
+
+    print(f'{len(manifest)} assets written to {ASSETS_DIR}.')
+
+
+@app.cli.command('profile-token')
+def profile_token_command():
+    """
+    Prints a _profile query flag that profiles the request carrying it.
+    """
+    if profiler is None or profiler.serializer is None:
+        raise click.ClickException('Set PROFILE_DIR and SECRET_KEY to enable the profiler.')
+
+    print(f'{PROFILE_FLAG}={profiler.token()}')
+
+
+@app.cli.command('outbox-status')
+def outbox_status_command():
+    """
+    Counts the Telegram outbox messages by delivery status.
+    """
+    for status, count in sorted(outbox.counts().items()):
+        print(f'{status}: {count}')
+
+
+OFFER_HEADINGS = {
+    'Apenas Venda'      : '💵 #VENDO\n\n',
+    'Apenas Troca'      : '🤝 #TROCO\n\n',
+    'Venda ou Troca'    : '⚖️ #VENDO OU #TROCO\n\n',
+    'Leilão Externo'    : '🔨 #LEILÃO\n\n',
+    'Procura'           : '🔎 #PROCURO\n\n',
+}
+
+
+def escape(text):
+    """
+    Escapes user provided text for Telegram's HTML parse mode.
+
+    Args:
+        text ([str]): [raw text]
+
+    Returns:
+        [str]: [escaped text]
+    """
+    return html.escape(text, quote=False)
 
 
 def remove_non_number(string):
@@ -61,144 +334,112 @@ def remove_non_number(string):
     return cleaned_string
 
 
-def assemble_message(adtype, text_list, output):
+def catalog_tags(names):
     """
-    Assembles the output message
+    Gets the hashtags of the boardgames, from the catalog when they are
+    stored and up to date, otherwise generating (and memoizing) them.
 
     Args:
-        adtype ([str]): [type of message]
-        text_list ([str]): [items]
-        output ([str]): [output message]
+        names ([list]): [boardgame names]
 
     Returns:
-        [str]: [output message]
+        [dict]: [hashtag of each name]
     """
-    if len(text_list) > 0:
-        if adtype == 'Apenas Venda':
-            output += '💵 #VENDO\n\n'
-
-        elif adtype == 'Apenas Troca':
-            if '#' in output:
-                output += '\n'
-            output += '🤝 #TROCO\n\n'
+    dbquery = db.session.query(Names.name, Names.tag).filter(
+        Names.name.in_(set(names)), Names.tag_version == hashtag.RULES_VERSION)
 
-        elif adtype == 'Venda ou Troca':
-            if '#' in output:
-                output += '\n'
-            output += '⚖️ #VENDO OU #TROCO\n\n'
+    tags = {result.name: result.tag for result in dbquery}
 
-        elif adtype == 'Leilão Externo':
-            if '#' in output:
-                output += '\n'
-            output += '🔨 #LEILÃO\n\n'
-
-        else:
-            if '#' in output:
-                output += '\n'
-            output += '🔎 #PROCURO\n\n'
+    with TAGGING_SECONDS.time():
+        for name in names:
+            if name not in tags:
+                tags[name] = memo_tag(name)
 
-        for ad in text_list:
-            output += f'{ad}\n'
-
-    return output
+    return tags
 
 
 def handle_data(data, int_keys):
     """
-    Handles the unpacked form data into the output message
-    and sends it to Telegram as a POST request.
+    Handles the unpacked form data into the output messages
+    and queues them on the Telegram outbox.
 
     Args:
         data ([dict]): [unpacked form data]
         int_keys ([list]): [data indexes]
     """
-    output = ''
     print(data)
 
+    tags = catalog_tags([data[index].get('boardgame') for index in int_keys])
+
+    city = data['city'].title().replace('-', '').replace(' ', '').replace("'", '')
+    state = data['state']
+
+    general_details = escape(data['general_details'].strip())
+
+    if len(general_details) > 0:
+        footer = f'\n{general_details}\n\n📌 #{escape(city)} #{state}'
+
+    else:
+        footer = f'\n📌 #{escape(city)} #{state}'
+
     if data['message_type'] == 'boardgame':
-        sell, trade, trade_or_sell, auction, search = [], [], [], [], []
+        sections = {offer: [] for offer in OFFER_HEADINGS}
 
         for index in int_keys:
             boardgame = data[index].get('boardgame')
-            formatted_name = hashtag.generate_tag(boardgame)
+            formatted_name = escape(tags[boardgame])
 
             data[index]['name'] = formatted_name
-            formatted_name = data[index]['name']
             offer = data[index]['offer']
-            details = data[index]['details']
+            details = escape(data[index]['details'])
 
-            if offer == 'Apenas Venda':
+            if offer in ('Apenas Venda', 'Venda ou Troca'):
                 price = remove_non_number(data[index]['price'])
-                message = f'\t\t↳ {formatted_name} R$ {price}\n\t\t{details}'.rstrip(
-                )
-                sell.append(message)
+                message = f'\t\t↳ {formatted_name} R$ {price}\n\t\t{details}'.rstrip()
 
-            elif offer == 'Apenas Troca':
+            else:
                 message = f'\t\t↳ {formatted_name}\n\t\t{details}'.rstrip()
-                trade.append(message)
 
-            elif offer == 'Venda ou Troca':
-                price = remove_non_number(data[index]['price'])
-                message = f'\t\t↳ {formatted_name} R$ {price}\n\t\t{details}'.rstrip(
-                )
-                trade_or_sell.append(message)
-
-            elif offer == 'Leilão Externo':
-                message = f'\t\t↳ {formatted_name}\n\t\t{details}'.rstrip()
-                auction.append(message)
+            sections[offer if offer in sections else 'Procura'].append(f'{message}\n')
 
-            else:
-                message = f'\t\t↳ {formatted_name}\n\t\t{details}'.rstrip()
-                search.append(message)
+        builder = MessageBuilder(f'<strong>Anúncios de @{data.get("username")}</strong>\n\n', footer)
 
-        output += f'<strong>Anúncios de @{data.get("username")}</strong>' + '\n\n'
+        for offer, items in sections.items():
+            builder.section(OFFER_HEADINGS[offer])
 
-        for adtype, text_list in zip(['Apenas Venda', 'Apenas Troca', 'Venda ou Troca', 'Leilão Externo', 'Procura'], [sell, trade, trade_or_sell, auction, search]):
-            output = assemble_message(adtype, text_list, output)
+            for item in items:
+                builder.item(item)
 
     else:
         username = data.get("username")
         ending_date = data.get('ending_date')
         ending_hour = data.get('ending_hour')
 
-        output += f'<strong>Leilão de @{username}</strong>' + '\n\n'
-        output += f'Encerramento: {format_date(ending_date)} às {ending_hour}h' + '\n\n'
+        builder = MessageBuilder(
+            f'<strong>Leilão de @{username}</strong>\n\n'
+            f'Encerramento: {escape(format_date(ending_date))} às {escape(ending_hour)}h\n\n',
+            footer,
+        )
 
         for index in int_keys:
             boardgame = data[index].get('boardgame')
-            starting_price = format_price(data[index].get('starting_price'))
-            increment = format_price(data[index].get('increment'))
-            details = data[index].get('details').strip()
-            formatted_name = hashtag.generate_tag(boardgame)
-
-            if index > 1:
-                output += f'\nJogo: #{format_index(index)} {formatted_name}\n'
-
-            else:
-                output += f'Jogo: #{format_index(index)} {formatted_name}\n'
+            starting_price = escape(format_price(data[index].get('starting_price')))
+            increment = escape(format_price(data[index].get('increment')))
+            details = escape(data[index].get('details').strip())
+            formatted_name = escape(tags[boardgame])
 
-            output += f'Lance inicial: R$ {starting_price}.\n'
-            output += f'Incremento: R$ {increment}.\n'
+            parts = [
+                f'Jogo: #{format_index(index)} {formatted_name}\n',
+                f'Lance inicial: R$ {starting_price}.\n',
+                f'Incremento: R$ {increment}.\n',
+            ]
 
             if len(details) > 0:
-                output += f'Detalhes: {details}\n'
+                parts.append(f'Detalhes: {details}\n')
 
-    city = data['city'].title().replace('-', '').replace(' ', '').replace("'", '')
-    state = data['state']
-
-    general_details = data['general_details'].strip()
-
-    if len(general_details) > 0:
-        output += f'\n{general_details}\n\n'
-        output += f'📌 #{city} #{state}'
+            builder.item(''.join(parts), separator='\n')
 
-    else:
-        output += f'\n📌 #{city} #{state}'
-
-    output = urllib.parse.quote_plus(output)
-
-    url = f'https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage?chat_id={BGB_BAZAR_CHANNEL_ID}&text={output}&parse_mode=HTML'
-    requests.post(url)
+    outbox.enqueue(BGB_BAZAR_CHANNEL_ID, builder.build())
 
 
 def format_date(date):
@@ -227,8 +468,7 @@ def format_index(index):
     Returns:
         [str]: [index]
     """
-    if index < 10:
-        return f'0{index}'
+    return f'{index:02d}'
 
 
 def format_price(price):
@@ -261,13 +501,7 @@ def check_user(telegram_data):
         [bool or db_query]: [if the user is not registered, returns false.
                              otherwise, returns the db query.]
     """
-    con = sqlite3.connect(USERS_DB_NAME)
-    cur = con.cursor()
-
-    db_user = cur.execute(f'SELECT * FROM users WHERE id={telegram_data["id"]}').fetchone()
-
-    con.commit()
-    con.close()
+    db_user = users.get(telegram_data['id'])
 
     if db_user is None:
         return False
@@ -276,13 +510,24 @@ def check_user(telegram_data):
         return db_user
 
 
-def validate_boardgames(name):
-    dbquery = Names.query.filter_by(name=name).all()
-    
-    if len(dbquery) == 0:
-        return False
+def unknown_boardgames(names):
+    """
+    Checks every submitted boardgame against the catalog in a single query
+
+    Args:
+        names ([list]): [boardgame names]
+
+    Returns:
+        [list]: [names that are not in the catalog, in submission order]
+    """
+    names = list(dict.fromkeys(names))
+
+    if len(names) == 0:
+        return []
+
+    known = {row.name for row in db.session.query(Names.name).filter(Names.name.in_(names))}
 
-    return True
+    return [name for name in names if name not in known]
 
 
 def unpack_data(form_data, telegram_data, data_source):
@@ -291,19 +536,19 @@ def unpack_data(form_data, telegram_data, data_source):
 
     Args:
         form_data ([dict]): [unpacked form data]
-        telegram_data ([dict]): [telegram auth data]
+        telegram_data ([dict]): [authenticated user, with its telegram id and username]
         data_source ([str]): [if the data is from an auction or standard boardgame]
 
     Returns:
-        [dict]: [unpacked data]
-        [list]: [index numbers]
+        [dict or list]: [unpacked data, or the unknown boardgames]
+        [list or bool]: [index numbers, or false if any boardgame is unknown]
     """
-    con = sqlite3.connect(USERS_DB_NAME)
-    cur = con.cursor()
+    unknown = unknown_boardgames([games['boardgame'] for games in form_data.boardgames.data])
 
-    db_user = check_user(telegram_data)
+    if len(unknown) > 0:
+        return unknown, False
 
-    future_date = datetime.now() + timedelta(hours=168) - timedelta(hours=3)
+    future_date = int(time.time()) + POST_COOLDOWN
 
     data = {}
 
@@ -342,31 +587,29 @@ def unpack_data(form_data, telegram_data, data_source):
                 'details'   : games['details'],
             }
 
-        if not validate_boardgames(games['boardgame']):
-            return games['boardgame'], False
-
         index += 1
 
     int_keys = list(filter(lambda i: type(i) == int, data.keys()))
 
-    if db_user is False:
-        cur.execute('INSERT INTO users VALUES (:id, :username, :is_banned, :block_until)', {
-                        'id'            : telegram_data['id'],
-                        'username'      : telegram_data['username'],
-                        'is_banned'     : 0,
-                        'block_until'   : future_date,
-                    })
+    users.block(telegram_data['id'], telegram_data['username'], future_date)
 
-    else:
-        cur.execute('UPDATE users SET block_until = :block_until WHERE id = :id', {
-                        'block_until'   : future_date,
-                        'id'            : telegram_data['id'],
-                    })
+    return data, int_keys
 
-    con.commit()
-    con.close()
 
-    return data, int_keys
+def unknown_message(names):
+    """
+    Lists the unknown boardgames for the flash message
+
+    Args:
+        names ([list]): [unknown boardgame names]
+
+    Returns:
+        [str]: [message start]
+    """
+    if len(names) == 1:
+        return f'O jogo {names[0]} não está em nosso banco de dados'
+
+    return f'Os jogos {", ".join(names[:-1])} e {names[-1]} não estão em nosso banco de dados'
 
 
 def authenticate(telegram_data):
@@ -396,24 +639,93 @@ def authenticate(telegram_data):
 
     data_check_string = '\n'.join(data_check_string)
 
-    token_secret_key = hashlib.sha256(TELEGRAM_TOKEN.encode()).digest()
-    hmac_hash = hmac.new(token_secret_key, msg=data_check_string.encode(), digestmod=hashlib.sha256).hexdigest()
+    hmac_hash = hmac.new(TELEGRAM_SECRET_KEY, msg=data_check_string.encode(), digestmod=hashlib.sha256).hexdigest()
 
     auth_date = datetime.fromtimestamp(int(auth_data['auth_date']))
     now = datetime.now()
 
     auth_delta = now - auth_date
 
-    if hmac_hash != auth_hash:
+    if auth_hash is None or not hmac.compare_digest(hmac_hash, auth_hash):
         return False
 
-    elif auth_delta.seconds > day_auth_time:
+    elif auth_delta.total_seconds() > day_auth_time:
         return False
 
     else:
         return True
 
 
+def user_status(user_id):
+    """
+    Reads the ban flag and cooldown end kept in the session
+
+    Args:
+        user_id ([int]): [telegram user id]
+
+    Returns:
+        [dict]: [ban flag, cooldown end and time of the read]
+    """
+    checked = time.time()
+    db_user = check_user({'id': user_id})
+
+    return {
+        'is_banned'     : 0 if db_user is False else db_user[2],
+        'block_until'   : 0 if db_user is False else db_user[3],
+        'checked'       : checked,
+    }
+
+
+def start_session(telegram_data):
+    """
+    Stores the authenticated user in a short-lived signed session, so the
+    next requests skip authenticate() and check_user()
+
+    Args:
+        telegram_data ([dict]): [authenticated telegram auth data]
+
+    Returns:
+        [dict]: [session user]
+    """
+    user = {
+        'id'            : int(telegram_data['id']),
+        'username'      : telegram_data['username'],
+        'expires'       : int(time.time()) + SESSION_TTL,
+        **user_status(telegram_data['id']),
+    }
+
+    session['user'] = user
+
+    return user
+
+
+def session_user(user_id=None):
+    """
+    Reads the user of the current session
+
+    Args:
+        user_id ([str]): [telegram id of the login params, if any]
+
+    Returns:
+        [dict or None]: [session user, or none if there is no valid session for this user]
+    """
+    user = session.get('user')
+
+    if user is None or user['expires'] <= time.time():
+        return None
+
+    if user_id is not None and str(user['id']) != user_id:
+        return None
+
+    # A ban, block or reset since the status was read must not wait for the
+    # session to expire.
+    if users.changed_since(user.get('checked', 0)):
+        user = dict(user, **user_status(user['id']))
+        session['user'] = user
+
+    return user
+
+
 def bgg_query(game):
     """
     BGG's query.
@@ -424,10 +736,14 @@ def bgg_query(game):
     Returns:
         [str]: [request's response text]
     """
-    url = f'https://www.boardgamegeek.com/xmlapi/search?search={game}'
-    request = requests.get(url)
+    def fetch():
+        url = f'{BGG_API_URL}/xmlapi/search?search={game}'
+        request = http.get(url)
+        request.raise_for_status()
+
+        return request.text
 
-    return request.text
+    return bgg_flight.do(fold(game).strip(), fetch)
 
 
 def search_bgg(name):
@@ -441,7 +757,19 @@ def search_bgg(name):
         [list]: [boardgame names]
     """
 
-    bgg_response = bgg_query(name)
+    return parse_bgg(bgg_query(name))
+
+
+def parse_bgg(bgg_response):
+    """
+    Reads the boardgame names of a BGG search.
+
+    Args:
+        bgg_response ([str]): [BGG's search response text]
+
+    Returns:
+        [list]: [boardgame names]
+    """
     soup = BeautifulSoup(bgg_response, 'lxml')
 
     games = []
@@ -476,6 +804,66 @@ def format_cj_name(name):
         return ""
 
 
+def catalog_rows_after(row_id):
+    """
+    Lists the catalog rows inserted after a given one, for the trigram index
+    to catch up with the other workers' inserts.
+
+    Args:
+        row_id ([int]): [highest boardgames.id already indexed]
+
+    Returns:
+        [list]: [(id, name) of the newer rows]
+    """
+    con = db.engine.raw_connection()
+    rows = con.execute('SELECT id, name FROM boardgames WHERE id > ?', (row_id,)).fetchall()
+    con.close()
+
+    return rows
+
+
+def refresh_catalog():
+    """
+    Picks up the names the other workers inserted in the catalog, clearing
+    the search cache when there are any. Called before the cache is read;
+    it only looks at the catalog once per check interval.
+    """
+    if SEARCH_BACKEND == 'trigram':
+        catalog_index.refresh(catalog_rows_after)
+
+    elif SEARCH_BACKEND == 'snapshot':
+        catalog_snapshot.refresh()
+
+
+def search_catalog(name):
+    """
+    Searches the local catalog for names containing the term.
+
+    Args:
+        name ([str]): [search term]
+
+    Returns:
+        [list]: [boardgame names]
+    """
+    if SEARCH_BACKEND == 'fts5':
+        match = fts_match_expression(name)
+
+        if match is not None:
+            dbquery = db.session.execute(db.text(FTS_SEARCH_SQL), {'query': match})
+
+            return [result.name for result in dbquery]
+
+    elif SEARCH_BACKEND == 'trigram' and not needs_like_fallback(name):
+        return catalog_index.search(name)
+
+    elif SEARCH_BACKEND == 'snapshot' and not needs_like_fallback(name):
+        return catalog_snapshot.search(name)
+
+    dbquery = Names.query.filter(Names.name.like(f'%{name}%')).all()
+
+    return [result.name for result in dbquery]
+
+
 def search_comparajogos(name):
     """
     Comparajogos' query.
@@ -487,10 +875,10 @@ def search_comparajogos(name):
         [list]: [boardgames names]
     """
     name = format_cj_name(name)
-    url = 'https://btr620i3rc.execute-api.sa-east-1.amazonaws.com/'
+    url = COMPARAJOGOS_API_URL
     query = f'{{ product(where: {{name: {{_ilike: "{name}"}}}}) {{ name }} }}'
 
-    response = requests.post(url, json={'query': query})
+    response = http.post(url, json={'query': query})
     json_data = json.loads(response.text)
 
     results = [data['name'] for data in json_data['data']['product']]
@@ -498,6 +886,113 @@ def search_comparajogos(name):
     return results
 
 
+def catalog_names_inserted(rows):
+    """
+    Makes the names written by the catalog writer visible to searches.
+
+    Args:
+        rows ([list]): [(id, name) of the inserted rows]
+    """
+    if SEARCH_BACKEND == 'trigram':
+        catalog_index.load(rows)
+
+    elif SEARCH_BACKEND == 'snapshot':
+        con = db.engine.raw_connection()
+        catalog_snapshot.rebuild(con)
+        con.close()
+
+    search_cache.clear()
+
+
+catalog_writer = CatalogWriter(lambda: db.engine.raw_connection(), catalog_names_inserted,
+                               max_batch=CATALOG_BATCH_SIZE, flush_interval=CATALOG_FLUSH_INTERVAL)
+atexit.register(catalog_writer.flush)
+
+bgg_enricher = BackgroundEnricher(search_bgg, catalog_writer.add, max_workers=BGG_WORKERS,
+                                  max_pending=BGG_QUEUE_SIZE, negative_ttl=BGG_NEGATIVE_TTL)
+
+
+def search_candidates(name, generation, enricher=None):
+    """
+    Searches the catalog, queueing a BGG lookup when there are few results.
+
+    Args:
+        name ([str]): [search term]
+        generation ([int]): [search cache generation read before searching]
+        enricher ([BackgroundEnricher]): [queues the BGG lookups, bgg_enricher if none]
+
+    Returns:
+        [list]: [boardgame names]
+    """
+    results = search_cache.get_candidates(name)
+
+    if results is None:
+        results = search_catalog(name)
+        search_cache.set_candidates(name, results, generation)
+
+    if len(results) < 5:
+        (enricher or bgg_enricher).submit(name)
+
+    return results
+
+
+def rank_results(name, results, generation, games=None):
+    """
+    Ranks the catalog results, along with the games just found on BGG, and
+    caches the response.
+
+    Args:
+        name ([str]): [search term]
+        results ([list]): [boardgame names found in the catalog]
+        generation ([int]): [search cache generation read before searching]
+        games ([list]): [boardgame names found on BGG]
+
+    Returns:
+        [list]: [boardgame names, best matches first]
+    """
+    if games:
+        results = results + [game for game in games if game not in results]
+
+    with RANKING_SECONDS.time():
+        results = rank(results, name, limit=25, mode=RANKING_MODE)
+
+    search_cache.set_response(name, results, generation)
+
+    return results
+
+
+def search_ranked(name):
+    """
+    Searches the catalog and ranks the results. When there are few of them,
+    a BGG lookup is queued and, if BGG_INLINE_TIMEOUT is set, waited for,
+    holding the worker. Identical concurrent searches share one call.
+
+    Args:
+        name ([str]): [search term]
+
+    Returns:
+        [list]: [boardgame names, best matches first]
+    """
+    generation = search_cache.generation
+    results = search_candidates(name, generation)
+    games = None
+
+    if len(results) < 5 and BGG_INLINE_TIMEOUT > 0:
+        games = bgg_enricher.wait(name, BGG_INLINE_TIMEOUT)
+
+    return rank_results(name, results, generation, games)
+
+
+@app.before_first_request
+def start_outbox():
+    """
+    Starts the Telegram outbox dispatcher in the processes serving requests.
+    The flask commands and the retag pool's workers import the app too, and
+    must not send messages.
+    """
+    outbox.start()
+
+
 @app.route('/bgsearch')
 @cross_origin()
 def bgsearch():
@@ -507,48 +1002,130 @@ def bgsearch():
     Returns:
         [json]: [boardgames]
     """
-    name = request.args.get('bgquery')
+    name = request.args.get('bgquery', '')
 
-    dbquery = Names.query.filter(Names.name.like(f'%{name}%')).all()
-    results = [result.name for result in dbquery]
+    refresh_catalog()
+    cached = search_cache.get_response(name)
 
-    if len(results) < 5:
-        bgg = search_bgg(name)
+    if cached is not None:
+        return jsonify(bglist=cached)
 
-        if len(bgg) > 0:
-            for name in bgg:
-                new_game = Names(name=name)
-                db.session.add(new_game)
-                db.session.commit()
+    results = search_flight.do(name, lambda: search_ranked(name))
 
-        results = list(set([*results, *bgg])) 
+    return jsonify(bglist=results)
 
-    results.sort(key=lambda x: difflib.SequenceMatcher(None, x, name).ratio(), reverse=True)  
-    results = results[:25]  
 
-    return jsonify(bglist=results)
+@app.route('/citysearch')
+@cross_origin()
+def citysearch():
+    """
+    Receives the city autocomplete queries from the frontend
+
+    Returns:
+        [json]: [cities of the selected state starting with the typed text]
+    """
+    query = request.args.get('q', '')
+    state = request.args.get('state') or None
+
+    return jsonify(cities=city_index.search(query, state, limit=20))
+
+
+@app.route('/bgsearch/cache')
+def bgsearch_cache():
+    """
+    Reports the /bgsearch cache counters, used to size the cache.
+
+    Returns:
+        [json]: [cache stats]
+    """
+    return jsonify(search_cache.stats())
+
+@app.route('/metrics')
+def metrics():
+    """
+    Exposes the request, SQLite, upstream, tagging and ranking metrics of
+    every worker, in the Prometheus text format.
+
+    Returns:
+        [Response]: [metrics]
+    """
+    payload, content_type = render_metrics()
+
+    return Response(payload, content_type=content_type)
+
 
 @app.route('/reset')
 def reset():
     username = request.args.get('username')
 
-    con = sqlite3.connect(USERS_DB_NAME)
-    cur = con.cursor()
+    unlock_date = int(time.time()) - 86_400
 
-    unlock_date = datetime.now() - timedelta(days=1)
+    users.block_username(username, unlock_date)
 
-    db_user = cur.execute(f'SELECT * FROM users WHERE username="{username}"').fetchone()
+    return redirect('/')
 
-    if db_user:
-        cur.execute('UPDATE users SET block_until = :block_until WHERE username = :username', {
-                        'block_until' : unlock_date,
-                        'username'    : username,
-                    })
 
-    con.commit()
-    con.close()
+@app.template_global()
+def asset_url(filename):
+    """
+    Links a static file through its fingerprinted name, when it was built.
 
-    return redirect('/')
+    Args:
+        filename ([str]): [file name, relative to the static folder]
+
+    Returns:
+        [str]: [asset url]
+    """
+    fingerprinted = asset_manifest.get(filename)
+
+    if fingerprinted is None:
+        return url_for('static', filename=filename)
+
+    return url_for('fingerprinted_asset', filename=fingerprinted)
+
+
+@app.route('/assets/<path:filename>')
+def fingerprinted_asset(filename):
+    """
+    Serves the fingerprinted assets, precompressed, with immutable caching.
+
+    Returns:
+        [function]: [asset response]
+    """
+    return send_asset(ASSETS_DIR, filename, request.accept_encodings)
+
+
+def render_forms(boardgame_form=None, auction_form=None):
+    """
+    Renders the boardgame and auction forms. Without forms, renders the
+    empty ones shown to every visitor, from the fragment cache.
+
+    Args:
+        boardgame_form ([BoardGameForm]): [submitted boardgame form]
+        auction_form ([AuctionForm]): [submitted auction form]
+
+    Returns:
+        [Markup]: [forms markup]
+    """
+    if boardgame_form is not None:
+        return Markup(render_template('addons/forms.html', boardgame_form=boardgame_form, auction_form=auction_form))
+
+    return fragment_cache.render('forms', FORMS_TEMPLATES, lambda: render_template(
+        'addons/forms.html', boardgame_form=BoardGameForm(formdata=None), auction_form=AuctionForm(formdata=None)))
+
+
+def render_template_forms():
+    """
+    Renders the hidden item forms cloned by bgb.js, from the fragment cache.
+
+    Returns:
+        [Markup]: [template forms markup]
+    """
+    return fragment_cache.render('template_forms', TEMPLATE_FORMS_TEMPLATES, lambda: render_template(
+        'addons/template_forms.html',
+        _auction_template_form=AuctionItemForm(prefix='boardgames-_-', formdata=None),
+        _boardgame_template_form=BoardGameItemForm(prefix='boardgames-_-', formdata=None),
+    ))
 
 
 @app.route('/faq')
@@ -570,13 +1147,8 @@ def home():
     Returns:
         [function]: [renders the homepage, either directly or through redirects]
     """
-    auction_form = AuctionForm()
-    boardgame_form = BoardGameForm()
-
-    auction_template_form = AuctionItemForm(prefix='boardgames-_-')
-    boardgame_template_form = BoardGameItemForm(prefix='boardgames-_-')
-
     telegram_auth = False
+    forms_fragment = None
 
     telegram_data = {
         'id'        : request.args.get('id', None),
@@ -588,66 +1160,76 @@ def home():
         'photo_url' : request.args.get('photo_url', None)
     }
 
-    if telegram_data['id'] != None:
+    user = session_user(telegram_data['id'])
+
+    if user is None and telegram_data['id'] != None:
         
         if telegram_data['username'] == None:
             flash('Por favor, defina um nome de usuário no Telegram antes de utilizar este site.')
             return redirect(url_for('home'))
 
         if authenticate(telegram_data):
-            db_user = check_user(telegram_data)
+            user = start_session(telegram_data)
 
-            if db_user is False:
-                telegram_auth = True
+        else:
+            flash('Falha de autenticação. Por favor, tente realizar o login novamente.')
 
-            else:
-                is_banned = db_user[2]
-                block_until = datetime.strptime(db_user[3], '%Y-%m-%d  %H:%M:%S.%f')
-                timenow = datetime.now() - timedelta(hours=3)
+    if user is not None:
+        is_banned = user['is_banned']
+        block_until = user['block_until']
+        timenow = time.time()
 
-                if is_banned == 0 and block_until < timenow:
-                    telegram_auth = True
+        if is_banned == 0 and block_until < timenow:
+            telegram_auth = True
 
-                elif is_banned == 1:
-                    flash('Este usuário está banido do BGB Bazar e, por isso, não pode enviar mensagens.')
+        elif is_banned == 1:
+            flash('Este usuário está banido do BGB Bazar e, por isso, não pode enviar mensagens.')
 
-                elif block_until > timenow:
-                    flash(f'Você só poderá enviar uma nova mensagem após {block_until.strftime("%d/%m às %H:%Mh")}.')
-        
-        else:
-            flash('Falha de autenticação. Por favor, tente realizar o login novamente.')
+        elif block_until > timenow:
+            block_until = datetime.fromtimestamp(block_until, BRASILIA_TIMEZONE)
+            flash(f'Você só poderá enviar uma nova mensagem após {block_until.strftime("%d/%m às %H:%Mh")}.')
+
+    if request.method == 'POST' and telegram_auth:
+        auction_form = AuctionForm()
+        boardgame_form = BoardGameForm()
 
-    if request.method == 'POST':
         is_auction_submitted = auction_form.data.get('auction_submit')
         is_boardgame_submitted = boardgame_form.data.get('boardgame_submit')
 
         if auction_form.validate() and is_auction_submitted:
             ads, int_keys = unpack_data(
-                auction_form, telegram_data, data_source='auction')
+                auction_form, user, data_source='auction')
 
             if int_keys == False:
-                flash(f'O jogo {ads} não está em nosso banco de dados e, por isso, o envio do anúncio foi cancelado. \
+                flash(f'{unknown_message(ads)} e, por isso, o envio do anúncio foi cancelado. \
                         Siga as instruções no nosso FAQ.')
 
-            else:            
+            else:
                 handle_data(ads, int_keys)
-                
+                session.pop('user', None)
+
                 return redirect(url_for('home', success='true'))
 
         elif boardgame_form.validate() and is_boardgame_submitted:
             ads, int_keys = unpack_data(
-                boardgame_form, telegram_data, data_source='boardgame')
+                boardgame_form, user, data_source='boardgame')
 
             if int_keys == False:
-                flash(f'O jogo {ads} não está em nosso banco de dados e, por isso, o envio do anúncio foi cancelado. \
+                flash(f'{unknown_message(ads)} e, por isso, o envio do anúncio foi cancelado. \
                         Siga as instruções no nosso FAQ. O envio de jogos não listados no campo de autocompletar não é permitido.')
 
-            else:                   
+            else:
                 handle_data(ads, int_keys)
+                session.pop('user', None)
 
                 return redirect(url_for('home', success='true'))
 
-    return render_template('home.html', telegram_auth=telegram_auth, boardgame_form=boardgame_form, auction_form=auction_form, _boardgame_template_form=boardgame_template_form, _auction_template_form=auction_template_form)
+        forms_fragment = render_forms(boardgame_form, auction_form)
+
+    elif telegram_auth:
+        forms_fragment = render_forms()
+
+    return render_template('home.html', telegram_auth=telegram_auth, forms_fragment=forms_fragment, template_forms_fragment=render_template_forms())
 
 
 if __name__ == '__main__':
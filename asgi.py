@@ -0,0 +1,182 @@
+"""
+ASGI entry point: serves the app from an event loop.
+
+/bgsearch is answered by a coroutine. The catalog search and ranking run
+in a thread pool, and the BGG lookups for sparse results go out through
+an async HTTP client on the loop. Waiting for them ties up no worker, so
+a sparse search waits up to BGG_INLINE_TIMEOUT (1s here, off in the WSGI
+app) and answers with BGG's games too. Every other route runs the Flask
+app in a thread pool.
+
+Usage:
+    gunicorn asgi:application -k uvicorn.workers.UvicornWorker
+    uvicorn asgi:application
+"""
+import asyncio
+import json
+import os
+import time
+
+import app as bgb
+
+from concurrent.futures import ThreadPoolExecutor
+from enrichment import AsyncEnricher
+from http_client import AsyncHttpClient
+from metrics import REQUEST_SECONDS, flight_observer, upstream_observer
+from profiler import PROFILE_FLAG
+from singleflight import AsyncSingleFlight
+from urllib.parse import parse_qs
+from uvicorn.middleware.wsgi import WSGIMiddleware
+
+
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', 16))
+BGG_CONCURRENCY = int(os.getenv('BGG_CONCURRENCY', 32))
+BGG_INLINE_TIMEOUT = float(os.getenv('BGG_INLINE_TIMEOUT', 1.0))
+
+http = AsyncHttpClient(
+    connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05)),
+    read_timeout=float(os.getenv('HTTP_READ_TIMEOUT', 10)),
+    retries=int(os.getenv('HTTP_RETRIES', 2)),
+    failure_threshold=int(os.getenv('HTTP_CIRCUIT_FAILURES', 5)),
+    reset_timeout=float(os.getenv('HTTP_CIRCUIT_RESET', 30)),
+    on_request=upstream_observer({'bgg': bgb.BGG_API_URL}),
+)
+
+search_executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='bgsearch')
+search_flight = AsyncSingleFlight(timeout=bgb.BGSEARCH_FLIGHT_TIMEOUT, on_call=flight_observer('bgsearch'))
+
+
+async def search_bgg(name):
+    """
+    Send a query to BGG, without blocking the loop.
+
+    Args:
+        name ([str]): [boardgame name]
+
+    Returns:
+        [list]: [boardgame names]
+    """
+    response = await http.get(f'{bgb.BGG_API_URL}/xmlapi/search', params={'search': name})
+    response.raise_for_status()
+
+    return bgb.parse_bgg(response.text)
+
+
+bgg_enricher = AsyncEnricher(search_bgg, bgb.catalog_writer.add, max_concurrency=BGG_CONCURRENCY,
+                             max_pending=bgb.BGG_QUEUE_SIZE, negative_ttl=bgb.BGG_NEGATIVE_TTL)
+
+
+def search_candidates(name, generation):
+    with bgb.app.app_context():
+        return bgb.search_candidates(name, generation, enricher=bgg_enricher)
+
+
+async def search_ranked(name):
+    """
+    Searches the catalog and ranks the results, awaiting the BGG lookup
+    when there are few of them.
+
+    Args:
+        name ([str]): [search term]
+
+    Returns:
+        [list]: [boardgame names, best matches first]
+    """
+    loop = asyncio.get_running_loop()
+    generation = bgb.search_cache.generation
+    results = await loop.run_in_executor(search_executor, search_candidates, name, generation)
+    games = None
+
+    if len(results) < 5 and BGG_INLINE_TIMEOUT > 0:
+        games = await bgg_enricher.wait_async(name, BGG_INLINE_TIMEOUT)
+
+    return await loop.run_in_executor(search_executor, bgb.rank_results, name, results, generation, games)
+
+
+def cors_headers(scope):
+    """
+    Mirrors the headers Flask-CORS adds to /bgsearch.
+
+    Args:
+        scope ([dict]): [ASGI connection scope]
+
+    Returns:
+        [list]: [CORS response headers]
+    """
+    origin = dict(scope['headers']).get(b'origin')
+
+    if origin is None:
+        return [(b'access-control-allow-origin', b'*')]
+
+    return [(b'access-control-allow-origin', origin), (b'vary', b'Origin')]
+
+
+async def bgsearch(scope, params, send):
+    """
+    Receives the AJAX queries from the frontend, like app.bgsearch.
+
+    Args:
+        scope ([dict]): [ASGI connection scope]
+        params ([dict]): [query string values]
+        send ([function]): [ASGI send channel]
+    """
+    started = time.perf_counter()
+    name = params.get('bgquery', [''])[0]
+    bgb.refresh_catalog()
+    results = bgb.search_cache.get_response(name)
+
+    if results is None:
+        results = await search_flight.do(name, lambda: search_ranked(name))
+
+    body = json.dumps({'bglist': results}, separators=(',', ':')).encode() + b'\n'
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+    ]
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers + cors_headers(scope)})
+    await send({'type': 'http.response.body', 'body': body})
+
+    REQUEST_SECONDS.labels('/bgsearch', 'GET', 200).observe(time.perf_counter() - started)
+
+
+class Application:
+    """
+    Routes GET /bgsearch to its coroutine and every other request to the
+    Flask app, run in a pool of `threads` threads. Profiled /bgsearch
+    requests go to the Flask app too, where the profiler hooks live.
+    """
+
+    def __init__(self, flask_app, threads=ASGI_THREADS):
+        self.wsgi = WSGIMiddleware(flask_app, workers=threads)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['path'] == '/bgsearch' and scope['method'] == 'GET':
+            params = parse_qs(scope['query_string'].decode('utf-8', 'replace'), keep_blank_values=True)
+
+            if PROFILE_FLAG not in params:
+                return await bgsearch(scope, params, send)
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                bgg_enricher.start(asyncio.get_running_loop())
+                bgb.outbox.start()
+                await send({'type': 'lifespan.startup.complete'})
+
+            elif message['type'] == 'lifespan.shutdown':
+                await http.close()
+                bgb.catalog_writer.flush()
+                await send({'type': 'lifespan.shutdown.complete'})
+
+                return
+
+
+application = Application(bgb.app)
@@ -0,0 +1,167 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import abort, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE = {'.css', '.ico', '.js', '.json', '.svg', '.txt', '.webmanifest'}
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MANIFEST_NAME = 'manifest.json'
+
+mimetypes.add_type('application/manifest+json', '.webmanifest')
+
+
+def fingerprint(filename, data):
+    """
+    Adds the content hash of a file to its name.
+
+    Args:
+        filename ([str]): [file name, relative to the static folder]
+        data ([bytes]): [file content]
+
+    Returns:
+        [str]: [fingerprinted file name, e.g. bgb.3f2a1c9d0b4e.js]
+    """
+    root, extension = os.path.splitext(filename)
+
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+
+    with open(temporary, 'wb') as output:
+        output.write(data)
+
+    os.replace(temporary, path)
+
+
+def compressed_variants(data):
+    """
+    Compresses an asset with every available encoding, keeping only the
+    variants smaller than the original.
+
+    Args:
+        data ([bytes]): [file content]
+
+    Returns:
+        [dict]: [compressed content per file suffix]
+    """
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+
+    return {suffix: variant for suffix, variant in variants.items() if len(variant) < len(data)}
+
+
+def build_assets(static_dir, dist_dir):
+    """
+    Copies every static file to dist_dir under a fingerprinted name, with
+    gzip and brotli variants of the text assets, and writes the manifest.
+    Fingerprinted files are never rewritten, so running it again only adds
+    the files that changed.
+
+    Args:
+        static_dir ([str]): [static folder]
+        dist_dir ([str]): [output folder, inside or outside static_dir]
+
+    Returns:
+        [dict]: [fingerprinted name of each static file]
+    """
+    manifest = {}
+    dist_dir = os.path.abspath(dist_dir)
+
+    for folder, subfolders, filenames in os.walk(static_dir):
+        subfolders[:] = [name for name in subfolders if os.path.abspath(os.path.join(folder, name)) != dist_dir]
+
+        for name in filenames:
+            path = os.path.join(folder, name)
+            filename = os.path.relpath(path, static_dir).replace(os.sep, '/')
+
+            with open(path, 'rb') as source:
+                data = source.read()
+
+            fingerprinted = fingerprint(filename, data)
+            output = os.path.join(dist_dir, fingerprinted)
+            manifest[filename] = fingerprinted
+
+            if os.path.exists(output):
+                continue
+
+            if os.path.splitext(name)[1] in COMPRESSIBLE:
+                for suffix, variant in compressed_variants(data).items():
+                    write_atomic(output + suffix, variant)
+
+            write_atomic(output, data)
+
+    write_atomic(os.path.join(dist_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+
+    return manifest
+
+
+def load_manifest(dist_dir):
+    """
+    Reads the manifest written by build_assets.
+
+    Args:
+        dist_dir ([str]): [output folder of build_assets]
+
+    Returns:
+        [dict or None]: [fingerprinted name of each static file, or none if the assets were not built]
+    """
+    try:
+        with open(os.path.join(dist_dir, MANIFEST_NAME), encoding='utf-8') as manifest:
+            return json.load(manifest)
+
+    except (OSError, ValueError):
+        return None
+
+
+def send_asset(dist_dir, filename, accept_encodings):
+    """
+    Sends a fingerprinted asset, precompressed with the best encoding the
+    client accepts, with far-future immutable caching.
+
+    Args:
+        dist_dir ([str]): [output folder of build_assets]
+        filename ([str]): [fingerprinted file name]
+        accept_encodings ([werkzeug.datastructures.Accept]): [parsed Accept-Encoding header]
+
+    Returns:
+        [flask.Response]: [asset response]
+    """
+    path = safe_join(dist_dir, filename)
+
+    if path is None or filename == MANIFEST_NAME or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+
+    for name, suffix in ENCODINGS:
+        if accept_encodings[name] > 0 and os.path.isfile(path + suffix):
+            path, encoding = path + suffix, name
+            break
+
+    response = send_file(path, mimetype=mimetype, conditional=True)
+
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+
+    return response
@@ -0,0 +1,232 @@
+"""
+Load test of /bgsearch on one worker: the WSGI app on a sync gunicorn
+worker against the ASGI app (asgi.py) on a uvicorn worker.
+
+Each of the concurrent clients sends the autocomplete prefixes of the
+benchmark titles, one request per connection, and takes --client-latency
+seconds to send each request, like a phone on a slow network. A share
+(--sparse-ratio) of the requests are for games missing from the catalog,
+which both servers look up on BGG, waiting up to --bgg-inline-timeout
+seconds for the answer. BGG and Telegram are a local stub server
+answering after --bgg-delay seconds, and each server runs on fresh
+copies of names.db and users.db.
+
+Usage:
+    python benchmarks/load.py [--mode both] [--concurrency 50] [--duration 10] [--client-latency 0.05]
+                              [--sparse-ratio 0.1] [--bgg-delay 0.5] [--bgg-inline-timeout 1] [--output results.json]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from stubs import StubServer
+from suite import ROOT_DIR, TITLES, timings
+from urllib.parse import urlencode
+
+
+SERVERS = {
+    'sync'  : ['app:app'],
+    'async' : ['asgi:application', '--worker-class', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, workdir, stub, inline_timeout):
+    """
+    Starts one gunicorn worker serving the app in the given mode.
+
+    Args:
+        mode ([str]): [sync or async]
+        port ([int]): [port to listen on]
+        workdir ([str]): [folder with the database copies]
+        stub ([StubServer]): [stand-in for BGG and Telegram]
+        inline_timeout ([float]): [seconds a sparse search waits for BGG]
+
+    Returns:
+        [subprocess.Popen]: [gunicorn process]
+    """
+    env = dict(os.environ, **{
+        'NAMES_DB_NAME'             : os.path.join(workdir, 'names.db'),
+        'USERS_DB_NAME'             : os.path.join(workdir, 'users.db'),
+        'OUTBOX_DB_NAME'            : os.path.join(workdir, 'outbox.db'),
+        'PROMETHEUS_MULTIPROC_DIR'  : os.path.join(workdir, 'metrics'),
+        'SECRET_KEY'                : 'load-test',
+        'TELEGRAM_TOKEN'            : 'load-test',
+        'BGG_API_URL'               : stub.url,
+        'TELEGRAM_API_URL'          : stub.url,
+        'BGG_INLINE_TIMEOUT'        : str(inline_timeout),
+    })
+    command = [sys.executable, '-m', 'gunicorn', *SERVERS[mode], '--workers', '1', '--bind', f'127.0.0.1:{port}',
+               '--config', os.path.join(ROOT_DIR, 'gunicorn.conf.py'), '--chdir', ROOT_DIR, '--log-level', 'warning']
+
+    return subprocess.Popen(command, cwd=workdir, env=env)
+
+
+async def wait_until_ready(port, timeout=120):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            if (await fetch(port, '')).startswith(b'HTTP/1.1 200'):
+                return
+
+        except OSError:
+            pass
+
+        await asyncio.sleep(0.5)
+
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+async def fetch(port, term, latency=0):
+    """
+    Searches a term on a new connection, sending the second half of the
+    request after `latency` seconds.
+
+    Returns:
+        [bytes]: [raw response]
+    """
+    request = (f'GET /bgsearch?{urlencode({"bgquery": term})} HTTP/1.1\r\n'
+               f'Host: 127.0.0.1\r\nConnection: close\r\n\r\n').encode()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+    try:
+        half = len(request) // 2
+        writer.write(request[:half])
+        await writer.drain()
+        await asyncio.sleep(latency)
+        writer.write(request[half:])
+        await writer.drain()
+
+        return await reader.read()
+
+    finally:
+        writer.close()
+
+
+async def client(port, terms, sparse_every, latency, deadline, results):
+    for index in itertools.count(1):
+        if time.monotonic() >= deadline:
+            return
+
+        sparse = sparse_every > 0 and index % sparse_every == 0
+        term = f'Qzx{next(results["sparse_terms"])}' if sparse else terms[index % len(terms)]
+        started = time.perf_counter()
+
+        try:
+            response = await fetch(port, term, latency)
+
+        except OSError:
+            response = b''
+
+        if not response.startswith(b'HTTP/1.1 200'):
+            results['errors'] += 1
+
+        elif sparse:
+            results['sparse'].append(time.perf_counter() - started)
+            results['sparse_with_bgg'] += b' Stub' in response
+
+        else:
+            results['catalog'].append(time.perf_counter() - started)
+
+
+async def load(port, concurrency, duration, latency, sparse_ratio):
+    """
+    Runs the concurrent clients against a server.
+
+    Returns:
+        [dict]: [durations of the catalog and sparse searches, sparse searches answered with BGG's games, errors]
+    """
+    terms = [title[:size] for title in TITLES for size in range(1, len(title) + 1) if not title.startswith('Zz')]
+    sparse_every = round(1 / sparse_ratio) if sparse_ratio > 0 else 0
+    results = {'catalog': [], 'sparse': [], 'sparse_with_bgg': 0, 'errors': 0, 'sparse_terms': itertools.count()}
+    deadline = time.monotonic() + duration
+
+    await asyncio.gather(*[
+        client(port, terms[offset:] + terms[:offset], sparse_every, latency, deadline, results)
+        for offset in (index * len(terms) // concurrency for index in range(concurrency))
+    ])
+
+    return results
+
+
+def run(mode, args):
+    workdir = tempfile.mkdtemp(prefix=f'bgb-load-{mode}-')
+
+    for database in ('names.db', 'users.db'):
+        shutil.copy(os.path.join(ROOT_DIR, database), workdir)
+
+    stub = StubServer(delay=args.bgg_delay).start()
+    port = free_port()
+    server = start_server(mode, port, workdir, stub, args.bgg_inline_timeout)
+
+    try:
+        asyncio.run(wait_until_ready(port))
+        stub.requests.clear()
+        results = asyncio.run(load(port, args.concurrency, args.duration, args.client_latency, args.sparse_ratio))
+        answered = len(results['catalog']) + len(results['sparse'])
+
+        return {
+            'requests_per_second'   : answered / args.duration,
+            'errors'                : results['errors'],
+            'catalog'               : timings(results['catalog']) if results['catalog'] else {'count': 0},
+            'sparse'                : timings(results['sparse']) if results['sparse'] else {'count': 0},
+            'sparse_with_bgg'       : results['sparse_with_bgg'],
+            'bgg_lookups'           : len(stub.requests),
+        }
+
+    finally:
+        server.terminate()
+        server.wait(30)
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['sync', 'async', 'both'], default='both')
+    parser.add_argument('--concurrency', type=int, default=50, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per server')
+    parser.add_argument('--client-latency', type=float, default=0.05, help='seconds each client takes to send a request')
+    parser.add_argument('--sparse-ratio', type=float, default=0.1, help='share of searches for games missing from the catalog')
+    parser.add_argument('--bgg-delay', type=float, default=0.5, help='seconds the BGG stub takes to answer')
+    parser.add_argument('--bgg-inline-timeout', type=float, default=1.0, help='seconds a sparse search waits for BGG')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    modes = ['sync', 'async'] if args.mode == 'both' else [args.mode]
+    results = {
+        'cpu_count'         : os.cpu_count(),
+        'concurrency'       : args.concurrency,
+        'client_latency'    : args.client_latency,
+        'sparse_ratio'      : args.sparse_ratio,
+        'bgg_delay'         : args.bgg_delay,
+        'bgg_inline_timeout': args.bgg_inline_timeout,
+        **{mode: run(mode, args) for mode in modes},
+    }
+
+    output = json.dumps(results, indent=2)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output + '\n')
+
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
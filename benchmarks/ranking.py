@@ -0,0 +1,79 @@
+"""
+Compares the original full difflib sort against the bounded-heap rankers
+and checks that the compatible mode keeps the exact same ordering.
+
+Usage:
+    python benchmarks/ranking.py [path/to/names.db]
+"""
+import difflib
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ranking import process, rank
+from search import TrigramIndex
+
+
+TERMS = ['a', 'e', 'ca', 'the', 'war', 'cata', 'zomb', 'ticket', 'pandemic', 'Star Wars']
+
+
+def rank_sorted(candidates, query, limit=25):
+    """
+    The ranking /bgsearch used before the bounded heap.
+
+    Args:
+        candidates ([list]): [boardgame names]
+        query ([str]): [search term]
+        limit ([int]): [number of results]
+
+    Returns:
+        [list]: [best boardgame names, best first]
+    """
+    results = list(candidates)
+    results.sort(key=lambda x: difflib.SequenceMatcher(None, x, query).ratio(), reverse=True)
+
+    return results[:limit]
+
+
+def timed(function, workload):
+    started = time.perf_counter()
+    results = [function(candidates, term) for term, candidates in workload]
+
+    return results, time.perf_counter() - started
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else 'names.db'
+    con = sqlite3.connect(db_path)
+    index = TrigramIndex()
+    index.load(con.execute('SELECT id, name FROM boardgames'))
+    con.close()
+
+    workload = [(term, index.search(term)) for term in TERMS]
+
+    expected, sorted_time = timed(rank_sorted, workload)
+    compat, compat_time = timed(lambda candidates, term: rank(candidates, term, mode='difflib'), workload)
+
+    print(f'candidates:        {sum(len(candidates) for term, candidates in workload)}')
+    print(f'full difflib sort: {sorted_time * 1000:.1f} ms')
+    print(f'difflib top-k:     {compat_time * 1000:.1f} ms ({sorted_time / compat_time:.1f}x)')
+
+    if process is not None:
+        fast, fast_time = timed(lambda candidates, term: rank(candidates, term, mode='fast'), workload)
+        overlap = sum(len(set(a) & set(b)) for a, b in zip(expected, fast)) / sum(len(a) for a in expected)
+
+        print(f'rapidfuzz top-k:   {fast_time * 1000:.1f} ms ({sorted_time / fast_time:.1f}x, {overlap:.0%} overlap)')
+
+    mismatches = [term for (term, candidates), a, b in zip(workload, expected, compat) if a != b]
+    print(f'mismatches:        {len(mismatches)}')
+
+    if mismatches:
+        print('\n'.join(mismatches))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
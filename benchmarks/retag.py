@@ -0,0 +1,131 @@
+"""
+Measures how `flask retag` (catalog.retag_catalog) scales with --workers.
+
+Each run re-tags a fresh copy of names.db. Besides the wall time of every
+worker count, one worker's work is split into its parts: reading the
+chunks, generating the tags and writing them back, which SQLite does one
+transaction at a time, plus the parent's own work of splitting the
+catalog in chunks. SQLite runs the writes one at a time, but while a
+worker writes the others read and tag, so the speedup can grow linearly
+until the writes alone fill the run: it is bounded by the worker count
+and by the whole work over the writes and the parent's work. The
+measured speedup can't beat the machine's number of cores either.
+
+Usage:
+    python benchmarks/retag.py [--workers 1 2 4 8] [--chunk-size 2000] [--output results.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+sys.path.insert(0, ROOT_DIR)
+
+import hashtag
+
+from catalog import chunk_bounds, ensure_tag_columns, retag_catalog
+
+
+def fresh_copy(workdir):
+    path = os.path.join(workdir, 'names.db')
+    shutil.copy(os.path.join(ROOT_DIR, 'names.db'), path)
+
+    con = sqlite3.connect(path)
+    ensure_tag_columns(con)
+
+    return con
+
+
+def split_costs(workdir, chunk_size):
+    """
+    Times the parts of a retag run on one process.
+
+    Returns:
+        [dict]: [seconds spent splitting the catalog, reading, tagging and writing the chunks]
+    """
+    con = fresh_copy(workdir)
+    costs = {'parent_s': 0.0, 'read_s': 0.0, 'tagging_s': 0.0, 'write_s': 0.0}
+
+    started = time.perf_counter()
+    bounds = list(chunk_bounds(con, chunk_size))
+    costs['parent_s'] += time.perf_counter() - started
+
+    for first_id, last_id in bounds:
+        started = time.perf_counter()
+        rows = con.execute('SELECT id, name, tag FROM boardgames WHERE id BETWEEN ? AND ?', (first_id, last_id)).fetchall()
+        costs['read_s'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = [(row_id, hashtag.generate_tag(name)) for row_id, name, tag in rows]
+        costs['tagging_s'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+
+        with con:
+            con.executemany('UPDATE boardgames SET tag = ?, tag_version = ? WHERE id = ?',
+                            [(new_tag, hashtag.RULES_VERSION, row_id) for row_id, new_tag in results])
+
+        costs['write_s'] += time.perf_counter() - started
+
+    con.close()
+
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='worker counts to run')
+    parser.add_argument('--chunk-size', type=int, default=2000, help='rows per chunk')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bgb-retag-')
+
+    try:
+        costs = split_costs(workdir, args.chunk_size)
+        serial = costs['parent_s'] + costs['write_s']
+        total = sum(costs.values())
+        runs = {}
+
+        for workers in args.workers:
+            con = fresh_copy(workdir)
+            started = time.perf_counter()
+            tagged, changed = retag_catalog(con, workers=workers, chunk_size=args.chunk_size)
+            runs[workers] = {'seconds': time.perf_counter() - started, 'rows': tagged}
+            con.close()
+
+        baseline = runs[min(runs)]['seconds'] * min(runs)
+
+        for workers, run in runs.items():
+            run['rows_per_second'] = run['rows'] / run['seconds']
+            run['speedup'] = baseline / run['seconds']
+            run['speedup_bound'] = min(workers, total / serial)
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'cpu_count'     : os.cpu_count(),
+        'chunk_size'    : args.chunk_size,
+        **costs,
+        'serial_share'  : serial / total,
+        'runs'          : runs,
+    }
+    output = json.dumps(results, indent=2)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output + '\n')
+
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
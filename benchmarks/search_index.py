@@ -0,0 +1,75 @@
+"""
+Compares LIKE '%term%' table scans against the in-memory trigram index.
+
+Usage:
+    python benchmarks/search_index.py [path/to/names.db]
+"""
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import TrigramIndex
+
+
+TITLES = [
+    'Catan', 'Zombicide', 'Ticket to Ride', 'Pandemic', 'Carcassonne',
+    'Terraforming Mars', 'Azul', 'Gloomhaven', 'Wingspan', '7 Wonders',
+]
+
+
+def keystroke_workload(titles):
+    """
+    Expands titles into the prefixes the autocomplete sends while typing.
+
+    Args:
+        titles ([list]): [boardgame names]
+
+    Returns:
+        [list]: [search terms]
+    """
+    return [title[:size] for title in titles for size in range(1, len(title) + 1)]
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else 'names.db'
+    con = sqlite3.connect(db_path)
+    terms = keystroke_workload(TITLES)
+
+    started = time.perf_counter()
+    index = TrigramIndex()
+    index.load(con.execute('SELECT id, name FROM boardgames ORDER BY id'))
+    build_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    like_results = [
+        [row[0] for row in con.execute('SELECT name FROM boardgames WHERE name LIKE ? ORDER BY id', (f'%{term}%',))]
+        for term in terms
+    ]
+    like_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index_results = [index.search(term) for term in terms]
+    index_time = time.perf_counter() - started
+
+    con.close()
+
+    mismatches = [term for term, like, indexed in zip(terms, like_results, index_results) if like != indexed]
+
+    print(f'catalog rows:   {len(index)}')
+    print(f'queries:        {len(terms)}')
+    print(f'index build:    {build_time * 1000:.1f} ms')
+    print(f'LIKE scans:     {like_time * 1000:.1f} ms ({like_time / len(terms) * 1e6:.0f} us/query)')
+    print(f'trigram index:  {index_time * 1000:.1f} ms ({index_time / len(terms) * 1e6:.0f} us/query)')
+    print(f'speedup:        {like_time / index_time:.1f}x')
+    print(f'mismatches:     {len(mismatches)}')
+
+    if mismatches:
+        print('\n'.join(mismatches))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+Local stand-ins for BGG, Comparajogos and the Telegram Bot API.
+
+Point BGG_API_URL, COMPARAJOGOS_API_URL and TELEGRAM_API_URL at a running
+StubServer to exercise the app without reaching the real services.
+
+Usage:
+    python benchmarks/stubs.py [port] [--delay SECONDS] [--fail]
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import escape
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, content_type, body, headers=None):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+
+        return self.rfile.read(length).decode() if length else ''
+
+    def handle_request(self, method):
+        stub = self.server.stub
+        parts = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        body = self.read_body()
+
+        with stub.lock:
+            stub.requests.append((method, parts.path))
+
+        if stub.delay:
+            time.sleep(stub.delay)
+
+        if stub.fail:
+            return self.reply(503, 'text/plain', 'unavailable')
+
+        if parts.path == '/xmlapi/search':
+            return self.bgg_search(params.get('search', ''))
+
+        if parts.path.endswith('/sendMessage'):
+            if 'json' in self.headers.get('Content-Type', ''):
+                params.update(json.loads(body or '{}'))
+
+            elif body:
+                params.update({key: values[-1] for key, values in parse_qs(body).items()})
+
+            return self.telegram_send_message(params)
+
+        if method == 'POST':
+            return self.comparajogos(json.loads(body or '{}').get('query', ''))
+
+        return self.reply(404, 'text/plain', 'not found')
+
+    def bgg_search(self, term):
+        names = self.server.stub.bgg_results(term)
+        games = ''.join(
+            f'<boardgame objectid="{index}"><name primary="true">{escape(name)}</name></boardgame>'
+            for index, name in enumerate(names, start=1)
+        )
+
+        self.reply(200, 'text/xml', f'<?xml version="1.0" encoding="utf-8"?><boardgames>{games}</boardgames>')
+
+    def comparajogos(self, query):
+        names = self.server.stub.bgg_results(query.split('"')[1] if '"' in query else '')
+        data = {'data': {'product': [{'name': name} for name in names]}}
+
+        self.reply(200, 'application/json', json.dumps(data))
+
+    def telegram_send_message(self, params):
+        stub = self.server.stub
+
+        with stub.lock:
+            if stub.rate_limit_next > 0:
+                stub.rate_limit_next -= 1
+                data = {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                        'parameters': {'retry_after': 1}}
+
+                return self.reply(429, 'application/json', json.dumps(data), {'Retry-After': '1'})
+
+            stub.messages.append(params)
+            message_id = len(stub.messages)
+
+        data = {'ok': True, 'result': {'message_id': message_id, 'chat': {'id': params.get('chat_id')},
+                                       'text': params.get('text', '')}}
+
+        self.reply(200, 'application/json', json.dumps(data))
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that give up on a delayed answer (timeouts) are expected.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubServer:
+    """
+    Threaded HTTP server answering like BGG, Comparajogos and Telegram.
+
+    Args:
+        port ([int]): [port to listen on, 0 for any free port]
+        delay ([float]): [seconds to wait before answering]
+        fail ([bool]): [answer every request with a 503]
+    """
+
+    def __init__(self, port=0, delay=0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.rate_limit_next = 0
+        self.requests = []
+        self.messages = []
+        self.lock = threading.Lock()
+        self.server = StubHTTPServer(('127.0.0.1', port), StubHandler)
+        self.server.stub = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+
+        return f'http://{host}:{port}'
+
+    def bgg_results(self, term):
+        """
+        Makes up BGG results for a term: none for terms starting with 'zz'.
+
+        Args:
+            term ([str]): [search term]
+
+        Returns:
+            [list]: [boardgame names]
+        """
+        if term.lower().startswith('zz'):
+            return []
+
+        return [f'{term.title()} {suffix}' for suffix in ('Stub', 'Stub: Expansion', 'Stub Deluxe Edition')]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('port', type=int, nargs='?', default=8081)
+    parser.add_argument('--delay', type=float, default=0)
+    parser.add_argument('--fail', action='store_true')
+    args = parser.parse_args()
+
+    stub = StubServer(args.port, delay=args.delay, fail=args.fail)
+    print(f'Stub BGG/Comparajogos/Telegram listening on {stub.url}')
+    stub.server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""
+Benchmarks the hot paths: hashtag.generate_tag over the whole catalog,
+/bgsearch under a keystroke workload and handle_data on 50-item posts.
+
+BGG and Telegram are replaced by a local stub server and the app runs on
+copies of names.db and users.db, so the bundled databases are untouched.
+The tags of the whole catalog are checked against golden/hashtags.tsv.
+
+Usage:
+    python benchmarks/suite.py [--output results.json] [--repeat 3] [--update-golden]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+GOLDEN_PATH = os.path.join(BENCHMARKS_DIR, 'golden', 'hashtags.tsv')
+
+sys.path.insert(0, ROOT_DIR)
+
+from stubs import StubServer
+
+
+TITLES = [
+    'Catan', 'Zombicide', 'Ticket to Ride', 'Pandemic', 'Carcassonne',
+    'Terraforming Mars', 'Azul', 'Gloomhaven', 'Wingspan', '7 Wonders',
+    'Star Wars: Rebellion', 'Dungeons & Dragons', 'Marvel Champions', 'Zzyzx Unknown',
+]
+
+
+def timings(samples):
+    """
+    Summarizes a list of durations.
+
+    Args:
+        samples ([list]): [durations in seconds]
+
+    Returns:
+        [dict]: [total, mean, median, p95 and max, in milliseconds]
+    """
+    ordered = sorted(samples)
+
+    return {
+        'count'     : len(samples),
+        'total_ms'  : sum(samples) * 1000,
+        'mean_ms'   : statistics.mean(samples) * 1000,
+        'median_ms' : statistics.median(samples) * 1000,
+        'p95_ms'    : ordered[int(0.95 * (len(ordered) - 1))] * 1000,
+        'max_ms'    : ordered[-1] * 1000,
+    }
+
+
+def bench_generate_tag(app, update_golden):
+    import hashtag
+
+    with app.app.app_context():
+        names = [row.name for row in app.db.session.query(app.Names.name).order_by(app.Names.id)]
+
+    samples, tags = [], []
+
+    for name in names:
+        started = time.perf_counter()
+        tags.append(hashtag.generate_tag(name))
+        samples.append(time.perf_counter() - started)
+
+    lines = [f'{name}\t{tag}\n' for name, tag in zip(names, tags)]
+
+    if update_golden:
+        os.makedirs(os.path.dirname(GOLDEN_PATH), exist_ok=True)
+
+        with open(GOLDEN_PATH, 'w', encoding='utf-8', newline='\n') as golden:
+            golden.writelines(lines)
+
+    # Compared by name, so the catalog's duplicated rows, removed on startup
+    # by catalog.migrate_catalog, don't matter.
+    with open(GOLDEN_PATH, encoding='utf-8', newline='\n') as golden:
+        expected = dict(line.rstrip('\n').rsplit('\t', 1) for line in golden)
+
+    mismatches = [line for line, name, tag in zip(lines, names, tags) if expected.get(name) != tag]
+    mismatches += [None] * len(set(expected) - set(names))
+
+    return {
+        **timings(samples),
+        'names'             : len(names),
+        'golden_mismatches' : len(mismatches),
+        'first_mismatches'  : [line.rstrip('\n') for line in mismatches[:10] if line is not None],
+    }
+
+
+def bench_bgsearch(app):
+    terms = [title[:size] for title in TITLES for size in range(1, len(title) + 1)]
+    samples = []
+
+    with app.app.test_client() as client:
+        for term in terms:
+            started = time.perf_counter()
+            response = client.get('/bgsearch', query_string={'bgquery': term})
+            samples.append(time.perf_counter() - started)
+
+            assert response.status_code == 200
+
+    return {**timings(samples), 'queries': len(terms)}
+
+
+def boardgame_post(names):
+    offers = ['Apenas Venda', 'Apenas Troca', 'Venda ou Troca', 'Leilão Externo', 'Procura']
+    data = {
+        'message_type'      : 'boardgame',
+        'username'          : 'benchmark',
+        'userid'            : 1,
+        'city'              : 'São José dos Campos',
+        'state'             : 'SP',
+        'general_details'   : 'Retirada em mãos ou envio pelos Correios.',
+    }
+
+    for index, name in enumerate(names, start=1):
+        data[index] = {
+            'boardgame' : name,
+            'offer'     : offers[index % len(offers)],
+            'name'      : '',
+            'price'     : '199,90',
+            'details'   : 'Completo, cartas com sleeves.',
+        }
+
+    return data
+
+
+def auction_post(names):
+    data = {
+        'message_type'      : 'auction',
+        'username'          : 'benchmark',
+        'userid'            : 1,
+        'city'              : 'Porto Alegre',
+        'state'             : 'RS',
+        'general_details'   : '',
+        'ending_date'       : '2021-12-24',
+        'ending_hour'       : '21',
+    }
+
+    for index, name in enumerate(names, start=1):
+        data[index] = {
+            'boardgame'     : name,
+            'starting_price': '100',
+            'increment'     : '5',
+            'name'          : '',
+            'details'       : 'Lacrado.',
+        }
+
+    return data
+
+
+def bench_handle_data(app, stub, repeat):
+    with app.app.app_context():
+        names = [row.name for row in app.db.session.query(app.Names.name).order_by(app.Names.id).limit(50)]
+
+    results = {}
+    app.outbox.start()
+
+    for kind, build in [('boardgame', boardgame_post), ('auction', auction_post)]:
+        samples = []
+
+        for _ in range(repeat):
+            data = build(names)
+            int_keys = [key for key in data if type(key) == int]
+
+            with app.app.app_context():
+                started = time.perf_counter()
+                app.handle_data(data, int_keys)
+                samples.append(time.perf_counter() - started)
+
+        results[kind] = {**timings(samples), 'items': len(names)}
+
+    deadline = time.monotonic() + 10
+
+    while app.outbox.counts().get('pending', 0) > 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    results['telegram_messages'] = len(stub.messages)
+
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, text=True).strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each handle_data post')
+    parser.add_argument('--update-golden', action='store_true', help='rewrite golden/hashtags.tsv')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bgb-bench-')
+
+    for database in ('names.db', 'users.db'):
+        shutil.copy(os.path.join(ROOT_DIR, database), workdir)
+
+    stub = StubServer().start()
+    os.chdir(workdir)
+    os.environ.update({
+        'NAMES_DB_NAME'     : os.path.join(workdir, 'names.db'),
+        'USERS_DB_NAME'     : os.path.join(workdir, 'users.db'),
+        'OUTBOX_DB_NAME'    : os.path.join(workdir, 'outbox.db'),
+        'OUTBOX_CHAT_INTERVAL': '0',
+        'TELEGRAM_TOKEN'    : 'benchmark',
+        'BGG_API_URL'       : stub.url,
+        'TELEGRAM_API_URL'  : stub.url,
+    })
+
+    try:
+        started = time.perf_counter()
+        import app
+        startup = time.perf_counter() - started
+
+        results = {
+            'revision'      : git_revision(),
+            'python'        : platform.python_version(),
+            'platform'      : platform.platform(),
+            'timestamp'     : time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'startup_ms'    : startup * 1000,
+            'generate_tag'  : bench_generate_tag(app, args.update_golden),
+            'bgsearch'      : bench_bgsearch(app),
+            'handle_data'   : bench_handle_data(app, stub, args.repeat),
+        }
+
+        app.bgg_enricher.executor.shutdown(wait=True)
+        app.catalog_writer.flush()
+
+    finally:
+        stub.stop()
+        os.chdir(ROOT_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output + '\n')
+
+    print(output)
+
+    if results['generate_tag']['golden_mismatches'] > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
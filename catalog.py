@@ -0,0 +1,353 @@
+import csv
+import hashtag
+import logging
+import os
+import sqlite3
+import threading
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+
+logger = logging.getLogger(__name__)
+
+INSERT_NAME_SQL = '''INSERT OR IGNORE INTO boardgames (name, tag, tag_version)
+    SELECT :name, :tag, :tag_version WHERE NOT EXISTS (SELECT 1 FROM boardgames WHERE name = :name)'''
+
+TAG_COLUMNS = {
+    'tag'           : 'TEXT',
+    'tag_version'   : 'TEXT',
+}
+
+memo_tag = lru_cache(maxsize=4096)(hashtag.generate_tag)
+
+
+class CatalogWriter:
+    """
+    Write-behind buffer for new catalog names.
+
+    Names are collected in memory and written in a single transaction when
+    the batch is full or `flush_interval` seconds after the first pending
+    name. Inserts are INSERT OR IGNORE against the unique index on
+    boardgames.name, so names already in the catalog are skipped. New rows
+    are stored with their hashtag. The rows actually inserted are passed to
+    `on_flush`.
+    """
+
+    def __init__(self, connect, on_flush=None, max_batch=50, flush_interval=1.0):
+        self.connect = connect
+        self.on_flush = on_flush
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.buffer = {}
+        self.timer = None
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+    def add(self, names):
+        """
+        Buffers names to be inserted into the catalog.
+
+        Args:
+            names ([list]): [boardgame names]
+        """
+        with self.lock:
+            for name in names:
+                self.buffer[name] = None
+
+            full = len(self.buffer) >= self.max_batch
+
+            if not full and self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered names in one transaction.
+
+        Returns:
+            [list]: [(id, name) of the inserted rows]
+        """
+        with self.flush_lock:
+            with self.lock:
+                names = list(self.buffer)
+                self.buffer.clear()
+
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+
+            if len(names) == 0:
+                return []
+
+            inserted = []
+            con = self.connect()
+
+            try:
+                cur = con.cursor()
+
+                for name in names:
+                    cur.execute(INSERT_NAME_SQL, {
+                        'name'          : name,
+                        'tag'           : memo_tag(name),
+                        'tag_version'   : hashtag.RULES_VERSION,
+                    })
+
+                    if cur.rowcount > 0:
+                        inserted.append((cur.lastrowid, name))
+
+                con.commit()
+
+            except Exception:
+                con.rollback()
+                logger.exception('Failed to write %d catalog names', len(names))
+
+                return []
+
+            finally:
+                con.close()
+
+        if self.on_flush is not None and len(inserted) > 0:
+            self.on_flush(inserted)
+
+        return inserted
+
+
+def dedupe_catalog(con):
+    """
+    Removes duplicated names from the catalog, keeping the oldest row of
+    each, adds the unique index on boardgames.name and compacts names.db.
+
+    Args:
+        con ([sqlite3.Connection]): [names.db connection]
+
+    Returns:
+        [int]: [number of deleted rows]
+    """
+    cur = con.cursor()
+    cur.execute('DELETE FROM boardgames WHERE id NOT IN (SELECT MIN(id) FROM boardgames GROUP BY name)')
+    deleted = cur.rowcount
+
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS ix_boardgames_name ON boardgames (name)')
+    con.commit()
+
+    con.execute('VACUUM')
+    con.execute('ANALYZE')
+
+    return deleted
+
+
+def has_unique_names(con):
+    """
+    Checks if the unique index on boardgames.name exists.
+
+    Args:
+        con ([sqlite3.Connection]): [names.db connection]
+
+    Returns:
+        [bool]: [if the index exists]
+    """
+    return any(row[1] == 'ix_boardgames_name' and row[2] for row in con.execute('PRAGMA index_list(boardgames)'))
+
+
+def migrate_catalog(con):
+    """
+    Runs dedupe_catalog on a catalog that doesn't have the unique index on
+    boardgames.name yet, so it can run on every startup. Workers booting
+    together dedupe it once: the others find the index when they get the
+    write lock.
+
+    Args:
+        con ([sqlite3.Connection]): [names.db connection]
+
+    Returns:
+        [int]: [number of deleted rows]
+    """
+    if has_unique_names(con):
+        return 0
+
+    con.execute('BEGIN IMMEDIATE')
+
+    if has_unique_names(con):
+        con.rollback()
+
+        return 0
+
+    deleted = dedupe_catalog(con)
+    logger.warning('Removed %s duplicated boardgames and added the unique index on their names', deleted)
+
+    return deleted
+
+
+def ensure_tag_columns(con):
+    """
+    Adds the tag and tag_version columns to the boardgames table.
+
+    Args:
+        con ([sqlite3.Connection]): [names.db connection]
+    """
+    columns = {row[1] for row in con.execute('PRAGMA table_info(boardgames)')}
+
+    for column, column_type in TAG_COLUMNS.items():
+        if column not in columns:
+            try:
+                con.execute(f'ALTER TABLE boardgames ADD COLUMN {column} {column_type}')
+
+            except sqlite3.OperationalError:
+                # Another worker added it first.
+                pass
+
+    con.commit()
+
+
+def count_stale_tags(con):
+    """
+    Counts the boardgames whose tag was not generated by the current rules.
+
+    Args:
+        con ([sqlite3.Connection]): [names.db connection]
+
+    Returns:
+        [int]: [number of stale tags]
+    """
+    query = 'SELECT COUNT(*) FROM boardgames WHERE tag_version IS NOT ?'
+
+    return con.execute(query, (hashtag.RULES_VERSION,)).fetchone()[0]
+
+
+def backfill_tags(con, force=False, batch_size=1000):
+    """
+    Generates the hashtag of every boardgame with a stale (or missing) tag.
+
+    Args:
+        con ([sqlite3.Connection]): [names.db connection]
+        force ([bool]): [re-tag every boardgame, even up to date ones]
+        batch_size ([int]): [rows updated per transaction]
+
+    Returns:
+        [int]: [number of tagged boardgames]
+    """
+    if force:
+        rows = con.execute('SELECT id, name FROM boardgames').fetchall()
+
+    else:
+        query = 'SELECT id, name FROM boardgames WHERE tag_version IS NOT ?'
+        rows = con.execute(query, (hashtag.RULES_VERSION,)).fetchall()
+
+    for start in range(0, len(rows), batch_size):
+        batch = [
+            (hashtag.generate_tag(name), hashtag.RULES_VERSION, row_id)
+            for row_id, name in rows[start:start + batch_size]
+        ]
+
+        con.executemany('UPDATE boardgames SET tag = ?, tag_version = ? WHERE id = ?', batch)
+        con.commit()
+
+    return len(rows)
+
+
+def chunk_bounds(con, chunk_size):
+    """
+    Splits the catalog in id ranges of `chunk_size` rows, reading only the
+    primary key.
+
+    Args:
+        con ([sqlite3.Connection]): [names.db connection]
+        chunk_size ([int]): [rows per chunk]
+
+    Yields:
+        [tuple]: [first and last id of each chunk]
+    """
+    last_id = -1
+    query = 'SELECT MIN(id), MAX(id) FROM (SELECT id FROM boardgames WHERE id > ? ORDER BY id LIMIT ?)'
+
+    while True:
+        first_id, last_id = con.execute(query, (last_id, chunk_size)).fetchone()
+
+        if first_id is None:
+            return
+
+        yield first_id, last_id
+
+
+def retag_chunk(db_path, first_id, last_id):
+    """
+    Tags the catalog rows of an id range and writes them back in one
+    transaction. Runs on the retag worker processes, so the parent neither
+    ships the rows nor writes them.
+
+    Args:
+        db_path ([str]): [names.db path]
+        first_id ([int]): [first id of the chunk]
+        last_id ([int]): [last id of the chunk]
+
+    Returns:
+        [tuple]: [number of tagged rows, (id, name, old tag, new tag) rows whose tag changed]
+    """
+    con = sqlite3.connect(db_path, timeout=60)
+
+    try:
+        rows = con.execute('SELECT id, name, tag FROM boardgames WHERE id BETWEEN ? AND ?', (first_id, last_id)).fetchall()
+        results = [(row_id, name, tag, hashtag.generate_tag(name)) for row_id, name, tag in rows]
+
+        with con:
+            con.executemany('UPDATE boardgames SET tag = ?, tag_version = ? WHERE id = ?',
+                            [(new_tag, hashtag.RULES_VERSION, row_id) for row_id, name, old_tag, new_tag in results])
+
+    finally:
+        con.close()
+
+    return len(results), [row for row in results if row[2] != row[3]]
+
+
+def retag_catalog(con, workers=None, chunk_size=2000, report=None):
+    """
+    Re-tags the whole catalog across a process pool. Each worker reads,
+    tags and writes back its own chunks, each in its own transaction, and
+    returns the tags that changed for the report.
+
+    Args:
+        con ([sqlite3.Connection]): [names.db connection]
+        workers ([int]): [worker processes, defaults to the number of cores]
+        chunk_size ([int]): [rows per chunk]
+        report ([file]): [text file receiving a CSV of the changed tags]
+
+    Returns:
+        [tuple]: [number of tagged rows, number of changed tags]
+    """
+    workers = workers or os.cpu_count()
+    db_path = con.execute('PRAGMA database_list').fetchone()[2]
+    writer = csv.writer(report) if report is not None else None
+    tagged, changed = 0, 0
+
+    if writer is not None:
+        writer.writerow(['id', 'name', 'old_tag', 'new_tag'])
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        max_pending = 2 * workers
+        pending = deque()
+        chunks = chunk_bounds(con, chunk_size)
+
+        while True:
+            for first_id, last_id in chunks:
+                pending.append(executor.submit(retag_chunk, db_path, first_id, last_id))
+
+                if len(pending) >= max_pending:
+                    break
+
+            if len(pending) == 0:
+                break
+
+            count, changed_rows = pending.popleft().result()
+            tagged += count
+            changed += len(changed_rows)
+
+            if writer is not None:
+                writer.writerows(changed_rows)
+
+    return tagged, changed
@@ -0,0 +1,100 @@
+import bisect
+import heapq
+import os
+import unicodedata
+
+
+CITIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cities.tsv')
+
+
+def city_key(name):
+    """
+    Normalizes a city name for lookups: accents, case and repeated spaces
+    are ignored.
+
+    Args:
+        name ([str]): [city name]
+
+    Returns:
+        [str]: [lookup key]
+    """
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+    return ' '.join(stripped.casefold().split())
+
+
+class CityIndex:
+    """
+    Sorted-array index of the Brazilian cities, per state and for the whole
+    country.
+
+    Each scope keeps its (key, name) entries sorted by key, so the cities
+    starting with a prefix are a contiguous slice found by binary search.
+    """
+
+    def __init__(self, rows=()):
+        scopes = {None: set()}
+
+        for state, name in rows:
+            entry = (city_key(name), name)
+            scopes.setdefault(state, set()).add(entry)
+            scopes[None].add(entry)
+
+        self.entries = {scope: sorted(entries) for scope, entries in scopes.items()}
+        self.keys = {scope: [key for key, name in entries] for scope, entries in self.entries.items()}
+        self.names = {scope: dict(entries) for scope, entries in self.entries.items() if scope is not None}
+
+    @classmethod
+    def from_file(cls, path=CITIES_PATH):
+        """
+        Loads the cities from a tab-separated file of state and city lines.
+
+        Args:
+            path ([str]): [cities file]
+
+        Returns:
+            [CityIndex]: [index]
+        """
+        with open(path, encoding='utf-8') as cities:
+            return cls(line.rstrip('\n').split('\t') for line in cities if line.strip())
+
+    def search(self, prefix, state=None, limit=20):
+        """
+        Finds the cities starting with a prefix, shortest names first.
+
+        Args:
+            prefix ([str]): [typed text]
+            state ([str]): [state abbreviation, all states if none or unknown]
+            limit ([int]): [maximum number of cities]
+
+        Returns:
+            [list]: [city names]
+        """
+        key = city_key(prefix)
+
+        if len(key) == 0:
+            return []
+
+        scope = state if state in self.names else None
+        entries, keys = self.entries[scope], self.keys[scope]
+        start = bisect.bisect_left(keys, key)
+        end = bisect.bisect_left(keys, key + '\uffff', start)
+
+        return heapq.nsmallest(limit, (name for key, name in entries[start:end]), key=len)
+
+    def lookup(self, city, state):
+        """
+        Finds a city of a state, ignoring accents and case.
+
+        Args:
+            city ([str]): [city name]
+            state ([str]): [state abbreviation]
+
+        Returns:
+            [str or None]: [the city's official name, or none if the state has no such city]
+        """
+        return self.names.get(state, {}).get(city_key(city or ''))
+
+
+city_index = CityIndex.from_file()
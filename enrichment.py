@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import threading
+
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from search import fold
+
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundEnricher:
+    """
+    Runs catalog lookups against an upstream (BGG) off the request path.
+
+    Terms are queued on a bounded thread pool; when a lookup returns games,
+    they are handed to the merge callback, which writes them to names.db so
+    the next keystroke finds them locally. Terms that returned nothing are
+    remembered for a while so they are not sent upstream again; so are the
+    merged ones, whose games would otherwise be fetched and inserted twice
+    while the catalog still has few matches for them. A request that can
+    afford it may wait() for the lookup and use its games right away.
+    """
+
+    def __init__(self, lookup, merge, max_workers=2, max_pending=32, negative_ttl=3600, negative_size=4096):
+        self.lookup = lookup
+        self.merge = merge
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='enrichment')
+        self.negative = TTLCache(maxsize=negative_size, ttl=negative_ttl)
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def submit(self, term):
+        """
+        Queues a lookup, unless the term is already queued, recently
+        returned nothing or the queue is full.
+
+        Args:
+            term ([str]): [search term]
+
+        Returns:
+            [bool]: [whether the lookup was queued]
+        """
+        key = fold(term).strip()
+
+        if len(key) == 0:
+            return False
+
+        with self.lock:
+            if key in self.pending or key in self.negative or len(self.pending) >= self.max_pending:
+                return False
+
+            future = self.schedule(key, term)
+
+            if future is None:
+                return False
+
+            self.pending[key] = future
+
+        future.add_done_callback(lambda done: self.forget(key, done))
+
+        return True
+
+    def schedule(self, key, term):
+        return self.executor.submit(self.run, key, term)
+
+    def forget(self, key, future):
+        with self.lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+
+    def queued(self, term):
+        with self.lock:
+            return self.pending.get(fold(term).strip())
+
+    def wait(self, term, timeout):
+        """
+        Waits for the queued lookup of a term.
+
+        Args:
+            term ([str]): [search term]
+            timeout ([float]): [seconds to wait]
+
+        Returns:
+            [list or None]: [games found, or none if the lookup isn't queued, failed or took longer than timeout]
+        """
+        future = self.queued(term)
+
+        if future is None:
+            return None
+
+        try:
+            return future.result(timeout)
+
+        except Exception:
+            return None
+
+    def run(self, key, term):
+        try:
+            games = self.lookup(term)
+
+            if len(games) > 0:
+                self.merge(games)
+
+            with self.lock:
+                self.negative[key] = True
+
+            return games
+
+        except Exception:
+            logger.exception('Background lookup for %r failed', term)
+
+
+class AsyncEnricher(BackgroundEnricher):
+    """
+    BackgroundEnricher whose lookups are coroutines running on an event
+    loop, for the ASGI mode (see asgi.py).
+
+    A lookup waiting on the upstream holds no thread, so up to
+    `max_concurrency` of them can be in flight at once. Merges still go
+    through the thread pool, since they may write to SQLite. submit() can
+    be called from any thread once start() has bound the loop.
+    """
+
+    def __init__(self, lookup, merge, max_concurrency=32, max_pending=256, negative_ttl=3600, negative_size=4096):
+        super().__init__(lookup, merge, max_workers=1, max_pending=max_pending,
+                         negative_ttl=negative_ttl, negative_size=negative_size)
+        self.max_concurrency = max_concurrency
+        self.loop = None
+        self.semaphore = None
+
+    def start(self, loop):
+        self.loop = loop
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def schedule(self, key, term):
+        if self.loop is None:
+            return None
+
+        return asyncio.run_coroutine_threadsafe(self.run_async(key, term), self.loop)
+
+    async def wait_async(self, term, timeout):
+        """
+        Awaits the queued lookup of a term, without blocking the loop.
+
+        Args:
+            term ([str]): [search term]
+            timeout ([float]): [seconds to wait]
+
+        Returns:
+            [list or None]: [games found, or none if the lookup isn't queued, failed or took longer than timeout]
+        """
+        future = self.queued(term)
+
+        if future is None:
+            return None
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+
+        except Exception:
+            return None
+
+    async def run_async(self, key, term):
+        try:
+            async with self.semaphore:
+                games = await self.lookup(term)
+
+            if len(games) > 0:
+                await self.loop.run_in_executor(self.executor, self.merge, games)
+
+            with self.lock:
+                self.negative[key] = True
+
+            return games
+
+        except Exception:
+            logger.exception('Background lookup for %r failed', term)
@@ -1,6 +1,7 @@
+from cities import city_index
 from flask_wtf import FlaskForm
 from wtforms import FieldList, FormField, TextAreaField, StringField, SelectField, SubmitField
-from wtforms.validators import InputRequired, Length
+from wtforms.validators import InputRequired, Length, ValidationError
 
 
 STATES = [
@@ -17,6 +18,19 @@ OFFER = [
 ]
 
 
+def city_in_state(form, field):
+    """
+    Checks that the city belongs to the selected state, and replaces it with
+    its official name.
+    """
+    city = city_index.lookup(field.data, form.state.data)
+
+    if city is None:
+        raise ValidationError('Cidade não encontrada no estado selecionado.')
+
+    field.data = city
+
+
 class BoardGameItemForm(FlaskForm):
     offer       = SelectField('Tipo', choices=OFFER)
     boardgame   = StringField('Jogo', validators=[InputRequired()])
@@ -27,7 +41,7 @@ class BoardGameItemForm(FlaskForm):
 class BoardGameForm(FlaskForm):
     boardgames          = FieldList(FormField(BoardGameItemForm),
                            min_entries=1, max_entries=50)
-    city                = StringField('Cidade', validators=[InputRequired()])
+    city                = StringField('Cidade', validators=[InputRequired(), city_in_state])
     state               = SelectField('Estado', choices=STATES)
     general_details     = TextAreaField('Detalhes sobre o anúncio', render_kw={
                                     "rows": 4, "cols": 4}, validators=[Length(max=600)])
@@ -43,7 +57,7 @@ class AuctionItemForm(FlaskForm):
 
 class AuctionForm(FlaskForm):
     boardgames      = FieldList(FormField(AuctionItemForm), min_entries=1, max_entries=50)
-    city            = StringField('Cidade', validators=[InputRequired()])
+    city            = StringField('Cidade', validators=[InputRequired(), city_in_state])
     state           = SelectField('Estado', choices=STATES)
     ending_date     = StringField('Data', validators=[InputRequired()])
     ending_hour     = StringField('Horário', validators=[InputRequired()])
@@ -0,0 +1,83 @@
+import os
+import threading
+
+from flask import current_app, g
+from flask_wtf.csrf import generate_csrf
+from markupsafe import Markup
+
+
+CSRF_PLACEHOLDER = '__csrf_token_placeholder__'
+
+
+class FragmentCache:
+    """
+    Cache of rendered template fragments that are the same for every
+    visitor.
+
+    Fragments are rendered with a placeholder instead of the CSRF token,
+    which is put back on every request, so the cached markup holds nothing
+    personal. Flash messages must be rendered outside of the fragments.
+    Each entry is keyed by the mtime of the templates it was rendered from,
+    so editing a template (or deploying new ones) renders it again.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def template_mtimes(self, templates):
+        folder = os.path.join(current_app.root_path, current_app.template_folder)
+
+        return tuple(os.path.getmtime(os.path.join(folder, template)) for template in templates)
+
+    def render(self, name, templates, build):
+        """
+        Returns a cached fragment, rendering it first if a template changed.
+
+        Args:
+            name ([str]): [fragment name]
+            templates ([list]): [templates the fragment is rendered from]
+            build ([function]): [renders the fragment]
+
+        Returns:
+            [Markup]: [fragment with the CSRF token of the current session]
+        """
+        key = self.template_mtimes(templates)
+
+        with self.lock:
+            entry = self.entries.get(name)
+
+        if entry is None or entry[0] != key:
+            entry = (key, self.render_without_csrf(build))
+
+            with self.lock:
+                self.entries[name] = entry
+
+        html = entry[1]
+
+        if CSRF_PLACEHOLDER in html:
+            html = html.replace(CSRF_PLACEHOLDER, generate_csrf())
+
+        return Markup(html)
+
+    def render_without_csrf(self, build):
+        """
+        Renders a fragment with the placeholder as CSRF token. Flask-WTF
+        reuses the token stored in flask.g, so the session is left untouched.
+        """
+        field_name = current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token')
+        token = g.pop(field_name, None)
+        setattr(g, field_name, CSRF_PLACEHOLDER)
+
+        try:
+            return str(build())
+
+        finally:
+            g.pop(field_name, None)
+
+            if token is not None:
+                setattr(g, field_name, token)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,20 @@
+import os
+import shutil
+import tempfile
+
+
+# Every worker writes its metrics to this directory, and /metrics adds them
+# up (see metrics.py). It must be set before prometheus_client is imported,
+# here or in the workers.
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'bgb-metrics'))
+
+
+def on_starting(server):
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
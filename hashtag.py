@@ -1,59 +1,157 @@
+import hashlib
 import re
 
 
+# Stamped on the tags stored in names.db: any change to this file's rules
+# changes it, so stale tags can be found and re-generated.
+with open(__file__, 'rb') as source:
+    RULES_VERSION = hashlib.sha1(source.read().replace(b'\r\n', b'\n')).hexdigest()[:12]
+
+# Every pattern of the pipeline is compiled once, at import time.
+PATTERNS = [re.compile(pattern) for pattern in [
+    '([A][n]*)([^.]*)(Deck Building Game)',
+    r'(First|Second|Third|Fourth|Fifth|Sixth|Seventh)\s*Edition',
+    r'(Primeira|Segunda|Terceira|Quarta|Quinta|Sexta|Sétima)\s*Edição',
+    r'[\(\[].*?[\)\]]',
+    '[0-9]{5,}',
+    r'[0-9]+\s*–\s*[0-9]+',
+    '[0-9]+-[0-9]+',
+]]
+
+DECK_BUILDING_GAME = re.compile('Deck Building Game', flags=re.IGNORECASE)
+
+SPECIAL_CHARS = [
+    '?', '"', "'", '!', '¡', ',', 'ª',
+    '.', '‘', '¿', '{', '[', '}', ']',
+    '_', '#', '½', '+', '*', '%', 'º',
+    '°',
+    'The Board Game',
+    'The Boardgame',
+    'The BoardGame',
+    'Boardgame',
+    'BoardGame',
+    'Board Game',
+    'The Deckbuilding Game'
+    'Deck-Building Game',
+    'Expansion Pack',
+    'Expansion pack',
+    'Expansion',
+    'expansion',
+    'Volume',
+    'Vol.',
+    'Vol',
+    'The Miniatures Game',
+    'Tabletop Miniatures Game',
+    'Miniatures Game',
+]
+
+NUMBER_BEFORE_COLON = re.compile(r'\s+[0-9]*:')
+
+SPECIAL_MAPPING = {
+    'ö': 'o', 'à': 'a', 'ū': 'u', '&': 'N',
+    '$': 's',
+    'The Roleplaying Game': 'RPG',
+    'Roleplaying Game':     'RPG',
+    'Role Playing Game':    'RPG',
+    'X-Wing':               'XWing',
+    'Y-Wing':               'YWing',
+    'Set #':                'Set',
+}
+
+TAG_SEPARATORS = [
+    ':', '/', '\\', '–', '-', '—', '-'
+]
+
+SERIES = [
+    'Pandemic',             'Dungeons & Dragons',   'Zombicide',            'Zpocalypse',
+    'Zooloretto',           'Wings of Glory',       'World of Darkness',    'Black Plague',
+    'Green Horde',          'Zombie Dice',          'The Boardgame',        'Zombie Fluxx',
+    'DC',                   'Marvel',               'GURPS',                'Star Wars',
+    'O Senhor dos Anéis',   'A Guerra dos Tronos',  'Guerra dos Tronos',    'Tiny Epic',
+    'Invader',              'Dark Side',            'Bang',                 'Encantados',
+    'Exploding Kittens',    'Ticket to Ride',       'Clank',                '7 Wonders',
+    'Fronteira do Império', 'Lenda dos Cinco Anéis','Viticulture',          'El Grande',
+    'Pathfinder',           'Tormenta',             'T.I.M.E.',             'Advanced Dungeons & Dragons',
+    'Achtung',              'Kick-Ass',             'CO2'                   'Dungeon World',
+    'Chamado de Cthulhu',   'Tiny Dungeon',         'Ubongo',               'Warhammer 40k',
+    'Carcassonne',          'Alhambra',             'Alien vs Predator',    'Card Kingdoms',
+    'The Lord of the Rings','Core Rulebook',        'Bounty Hunters',       'Warhammer',
+    'Triumph of Chaos',     'Pokémon',              'Digimon',              'Torg Eternity',
+    'Munchkin',             'The Witcher',          'Viticulture: Tuscany', 'The Witcher: Old World',
+    'Star Wars: Destiny',	'Anachrony',      		'Patchwork',            'BANG',
+    'X-Wing',               'Y-Wing',               'A Máscara',            'Harry Potter',
+    'Dwar7s',               'Marco Polo',           'Glen More',            'Disney',
+    'Banco Imobiliário',    'Hanabi',               'Código Secreto',       'Codenames',
+    'Pixel Tactics',        'Adventure Time',       'Men of Iron',          'Deckscape',
+    'Kingdomino',           'Queendomino',          'Starcraft',            'Mass Effect',        
+]
+
+# One compiled pattern per serie, applied in the order they are listed so that
+# longer series ('Warhammer 40k') are split before the ones they contain
+# ('Warhammer'): 'Warhammer 40,000 Kill Team' is tagged
+# '#Warhammer #40k #KillTeam', never '#Warhammer #40kKillTeam'.
+#
+# SERIES_GATE matches if any of them does, so names without a serie are
+# handled in a single scan. The names it matches still go through the
+# patterns one by one: each replacement changes the text the next series are
+# matched against ('Warhammer 40k: ' makes 'Warhammer' match), so one pass
+# reporting a single serie per position can't give the same tags.
+SERIES_PATTERNS = [(serie, re.compile(rf'{serie}[\s][^:]')) for serie in SERIES]
+SERIES_GATE = re.compile('|'.join(f'(?:{pattern.pattern})' for serie, pattern in SERIES_PATTERNS))
+
+EDITIONS = [
+    'DeluxeEdition',
+    'SpecialEdition'
+]
+
+EDITION_TAG_EXCEPTIONS = [
+    ' ', '#'
+]
+
+SINGLE_HASHTAGS = [re.compile(pattern) for pattern in [
+    r'\s+#$', r'\s+#\s+'
+]]
+
+REDUNDANT_TAGS = [
+    '#TheBoardGame',
+    '#ADeckBuildingAdventure'
+]
+
+HASHTAG_FIXES = [re.compile(pattern, flags=re.IGNORECASE) for pattern in [
+    r'#[0-9]*[Ee]dição[\w]*\s*',
+    r'[0-9]{1,}[stndrdth]{2,}[Ee]dition[\w]*\s*',
+    r'[0-9]{1,}[Ee]dition[\w]*\s*',
+    'DeckBuildingGame',
+    '[Vv]ol[0-9]',
+    '#Expansão',
+    '#Expansion',
+]]
+
+ROMAN_NUMERALS = re.compile("([XVI]+)[XVI*]")
+
+EXCEPTIONS = {
+    '#ManoplaDoInfinito #UmJogoLoveLetter': '#ManoplaDoInfinito Um Jogo #LoveLetter',
+    '#Mission #RedPlanet': '#MissionRedPlanet'
+}
+
+
 def remove_patterns(string):
-    patterns = [
-        '([A][n]*)([^.]*)(Deck Building Game)',
-        '(First|Second|Third|Fourth|Fifth|Sixth|Seventh)\s*Edition',
-        '(Primeira|Segunda|Terceira|Quarta|Quinta|Sexta|Sétima)\s*Edição',
-        '[\(\[].*?[\)\]]',
-        '[0-9]{5,}',
-        '[0-9]+\s*–\s*[0-9]+',
-        '[0-9]+-[0-9]+',
-    ]
-
-    for pattern in patterns:
-        compiled = re.compile(pattern)
-        search = re.search(pattern, string)
+    for compiled in PATTERNS:
+        search = compiled.search(string)
 
         if search:
-            try:
-                string = re.sub(search.group(3), '', string, flags=re.IGNORECASE)
+            if compiled.groups >= 3:
+                string = DECK_BUILDING_GAME.sub('', string)
                 string = re.sub(search.group(1), '', string, flags=re.IGNORECASE)
 
-            except IndexError:
-                string = re.sub(compiled, '', string)
+            else:
+                string = compiled.sub('', string)
 
     return string
 
 
 def remove_special_chars(string):
-    special_chars = [
-        '?', '"', "'", '!', '¡', ',', 'ª',
-        '.', '‘', '¿', '{', '[', '}', ']',
-        '_', '#', '½', '+', '*', '%', 'º', 
-        '°',
-        'The Board Game',
-        'The Boardgame',
-        'The BoardGame',
-        'Boardgame',
-        'BoardGame',
-        'Board Game',
-        'The Deckbuilding Game'
-        'Deck-Building Game',
-        'Expansion Pack',
-        'Expansion pack',
-        'Expansion',
-        'expansion',
-        'Volume',
-        'Vol.',
-        'Vol',
-        'The Miniatures Game',
-        'Tabletop Miniatures Game',
-        'Miniatures Game',
-    ]
-
-    for char in special_chars:
+    for char in SPECIAL_CHARS:
         string = string.replace(char, '')
 
     return string
@@ -63,25 +161,13 @@ def replace_numbers(string):
     if 'Warhammer' in string:
         string = string.replace('Warhammer 40000', 'Warhammer 40k')
 
-    pattern = re.compile('\s+[0-9]*:')
-    string = re.sub(pattern, ':', string)
+    string = NUMBER_BEFORE_COLON.sub(':', string)
 
     return string
 
 
 def process_special_chars(string):
-    mapping = {
-        'ö': 'o', 'à': 'a', 'ū': 'u', '&': 'N',
-        '$': 's',
-        'The Roleplaying Game': 'RPG',
-        'Roleplaying Game':     'RPG',
-        'Role Playing Game':    'RPG',
-        'X-Wing':               'XWing',
-        'Y-Wing':               'YWing',
-        'Set #':                'Set',
-    }
-
-    for special, letter in mapping.items():
+    for special, letter in SPECIAL_MAPPING.items():
         string = string.replace(special, letter)
 
     return string
@@ -102,15 +188,11 @@ def merge_hyphens(string):
 
 
 def split_into_tags(string):
-    chars = [
-        ':', '/', '\\', '–', '-', '—', '-'
-    ]
-
     string = string.replace(' ', '')
     string = string.replace('-', ' #')
     string = string.strip()
 
-    for char in chars:
+    for char in TAG_SEPARATORS:
         string = string.replace(char, ' #')
 
     string = '#' + string
@@ -119,56 +201,23 @@ def split_into_tags(string):
 
 
 def manage_series(string):
-    series = {
-        'Pandemic',             'Dungeons & Dragons',   'Zombicide',            'Zpocalypse',
-        'Zooloretto',           'Wings of Glory',       'World of Darkness',    'Black Plague',
-        'Green Horde',          'Zombie Dice',          'The Boardgame',        'Zombie Fluxx',
-        'DC',                   'Marvel',               'GURPS',                'Star Wars',
-        'O Senhor dos Anéis',   'A Guerra dos Tronos',  'Guerra dos Tronos',    'Tiny Epic',
-        'Invader',              'Dark Side',            'Bang',                 'Encantados',
-        'Exploding Kittens',    'Ticket to Ride',       'Clank',                '7 Wonders',
-        'Fronteira do Império', 'Lenda dos Cinco Anéis','Viticulture',          'El Grande',
-        'Pathfinder',           'Tormenta',             'T.I.M.E.',             'Advanced Dungeons & Dragons',
-        'Achtung',              'Kick-Ass',             'CO2'                   'Dungeon World',
-        'Chamado de Cthulhu',   'Tiny Dungeon',         'Ubongo',               'Warhammer 40k',
-        'Carcassonne',          'Alhambra',             'Alien vs Predator',    'Card Kingdoms',
-        'The Lord of the Rings','Core Rulebook',        'Bounty Hunters',       'Warhammer',
-        'Triumph of Chaos',     'Pokémon',              'Digimon',              'Torg Eternity',
-        'Munchkin',             'The Witcher',          'Viticulture: Tuscany', 'The Witcher: Old World',
-        'Star Wars: Destiny',	'Anachrony',      		'Patchwork',            'BANG',
-        'X-Wing',               'Y-Wing',               'A Máscara',            'Harry Potter',
-        'Dwar7s',               'Marco Polo',           'Glen More',            'Disney',
-        'Banco Imobiliário',    'Hanabi',               'Código Secreto',       'Codenames',
-        'Pixel Tactics',        'Adventure Time',       'Men of Iron',          'Deckscape',
-        'Kingdomino',           'Queendomino',          'Starcraft',            'Mass Effect',        
-    }
-
-    for serie in series:
-        match = re.match(f'{serie}[\s][^:]', string)
-        search = re.search(f'{serie}[\s][^:]', string)
-
-        if match or search:
+    if SERIES_GATE.search(string) is None:
+        return string
+
+    for serie, pattern in SERIES_PATTERNS:
+        if pattern.search(string):
             string = string.replace(serie, f'{serie}: ')
 
     return string
 
 
 def fix_editions(string):
-    editions = [
-        'DeluxeEdition',
-        'SpecialEdition'
-    ]
-
-    tag_exceptions = [
-        ' ', '#'
-    ]
-
-    for edition in editions:
+    for edition in EDITIONS:
         index = string.find(edition)
 
         try:
             if index > 0:
-                if string[index-1] not in tag_exceptions:
+                if string[index-1] not in EDITION_TAG_EXCEPTIONS:
                     string = string.replace(edition, f' #{edition}')
 
         except IndexError:
@@ -178,42 +227,22 @@ def fix_editions(string):
 
 
 def remove_single_hashtag(string):
-    patterns = [
-        '\s+#$', '\s+#\s+'
-    ]
-
-    for pattern in patterns:
-        single_hashtag = re.compile(pattern)
-        string = re.sub(single_hashtag, ' ', string)
+    for single_hashtag in SINGLE_HASHTAGS:
+        string = single_hashtag.sub(' ', string)
 
     return string
 
 
 def remove_redundant_tags(string):
-    redundant_tags = [
-        '#TheBoardGame',
-        '#ADeckBuildingAdventure'
-    ]
-
-    for tag in redundant_tags:
+    for tag in REDUNDANT_TAGS:
         string = string.replace(tag, '')
 
     return string
 
 
 def fix_hashtags(string):
-    patterns = [
-        '#[0-9]*[Ee]dição[\w]*\s*',
-        '[0-9]{1,}[stndrdth]{2,}[Ee]dition[\w]*\s*',
-        '[0-9]{1,}[Ee]dition[\w]*\s*',
-        'DeckBuildingGame',
-        '[Vv]ol[0-9]',
-        '#Expansão',
-        '#Expansion',
-    ]
-
-    for pattern in patterns:
-        string = re.sub(pattern, ' ', string, flags=re.IGNORECASE).rstrip()
+    for pattern in HASHTAG_FIXES:
+        string = pattern.sub(' ', string).rstrip()
 
     rpg_index = string.find('RPG')
 
@@ -229,9 +258,7 @@ def fix_hashtags(string):
 
 
 def remove_roman_hashtags(string):
-    pattern = re.compile("([XVI]+)[XVI*]")
-
-    search = re.search(pattern, string)
+    search = ROMAN_NUMERALS.search(string)
 
     if search != None:
         string = string[:search.start()] + " " + search.group()
@@ -240,31 +267,35 @@ def remove_roman_hashtags(string):
 
 
 def manage_exceptions(string):
-    exceptions = {
-        '#ManoplaDoInfinito #UmJogoLoveLetter': '#ManoplaDoInfinito Um Jogo #LoveLetter',
-        '#Mission #RedPlanet': '#MissionRedPlanet'
-    }
-
-    if string in exceptions.keys():
-        string = exceptions[string]
+    if string in EXCEPTIONS.keys():
+        string = EXCEPTIONS[string]
 
     return string
 
 
+PIPELINE = (
+    remove_special_chars,
+    replace_numbers,
+    remove_patterns,
+    manage_series,
+    process_special_chars,
+    merge_hyphens,
+    split_into_tags,
+    remove_redundant_tags,
+    fix_hashtags,
+    fix_editions,
+    remove_roman_hashtags,
+    remove_single_hashtag,
+    manage_exceptions,
+)
+
+
 def generate_tag(game):
-    tag = remove_special_chars(game)
-    tag = replace_numbers(tag)
-    tag = remove_patterns(tag)
-    tag = manage_series(tag)
-    tag = process_special_chars(tag)
-    tag = merge_hyphens(tag)
-    tag = split_into_tags(tag)
-    tag = remove_redundant_tags(tag)
-    tag = fix_hashtags(tag)
-    tag = fix_editions(tag)
-    tag = remove_roman_hashtags(tag)
-    tag = remove_single_hashtag(tag)
-    tag = manage_exceptions(tag)
+    tag = game
+
+    for stage in PIPELINE:
+        tag = stage(tag)
+
     tag = tag.strip()
 
     return tag
@@ -0,0 +1,303 @@
+import asyncio
+import threading
+import time
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+
+except ImportError:
+    httpx = None
+
+
+RETRY_STATUSES = (500, 502, 503, 504)
+IDEMPOTENT_METHODS = {'DELETE', 'GET', 'HEAD', 'OPTIONS', 'PUT', 'TRACE'}
+
+
+class CircuitOpenError(ConnectionError):
+    """
+    Raised instead of calling a host whose circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Fails fast while an upstream host is down.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    every call is refused for `reset_timeout` seconds. Then a single trial
+    call is let through: success closes the circuit, failure reopens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        Checks if a call may go through.
+
+        Returns:
+            [bool]: [whether the circuit is closed or ready for a trial call]
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return True
+
+            if not self.trial and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.trial = True
+
+                return True
+
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+
+            return 'half-open' if self.trial else 'open'
+
+
+class HttpClient:
+    """
+    Shared outbound HTTP layer.
+
+    Keeps one keep-alive session (and connection pool) per host, applies
+    connect and read timeouts to every call, retries connection errors and
+    5xx answers to idempotent requests with exponential backoff, and isolates
+    failing hosts behind a circuit breaker.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, retries=2, backoff_factor=0.5,
+                 pool_maxsize=10, failure_threshold=5, reset_timeout=30, on_request=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_maxsize = pool_maxsize
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_request = on_request
+        self.sessions = {}
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def host_state(self, host):
+        """
+        Gets (or creates) the session and circuit breaker of a host.
+
+        Args:
+            host ([str]): [scheme and netloc, e.g. https://api.telegram.org]
+
+        Returns:
+            [tuple]: [requests.Session, CircuitBreaker]
+        """
+        with self.lock:
+            if host not in self.sessions:
+                retry = Retry(total=self.retries, backoff_factor=self.backoff_factor,
+                              status_forcelist=RETRY_STATUSES, raise_on_status=False)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=retry)
+
+                session = Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+
+                self.sessions[host] = session
+                self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+
+            return self.sessions[host], self.breakers[host]
+
+    def request(self, method, url, **kwargs):
+        """
+        Sends a request through the host's pooled session.
+
+        Args:
+            method ([str]): [HTTP method]
+            url ([str]): [full url]
+
+        Raises:
+            CircuitOpenError: [if the host's circuit is open]
+            RequestException: [if the request fails after its retries]
+
+        Returns:
+            [requests.Response]: [response]
+        """
+        parts = urlsplit(url)
+        host = f'{parts.scheme}://{parts.netloc}'
+        session, breaker = self.host_state(host)
+
+        if not breaker.allow():
+            self.report(host, 0, 'circuit_open')
+            raise CircuitOpenError(f'Circuit open for {host}')
+
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.perf_counter()
+
+        try:
+            response = session.request(method, url, **kwargs)
+
+        # Any error counts, not only RequestException: a half-open circuit
+        # whose trial call fails some other way must not stay half-open.
+        except Exception as error:
+            breaker.record_failure()
+            self.report(host, time.perf_counter() - started, type(error).__name__)
+            raise
+
+        self.report(host, time.perf_counter() - started, response.status_code)
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+
+        else:
+            breaker.record_success()
+
+        return response
+
+    def report(self, host, seconds, outcome):
+        """
+        Passes a call's duration and outcome to the on_request callback.
+
+        Args:
+            host ([str]): [scheme and netloc]
+            seconds ([float]): [call duration, retries included]
+            outcome ([int or str]): [HTTP status, or the error's name]
+        """
+        if self.on_request is not None:
+            self.on_request(host, seconds, outcome)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+
+            self.sessions.clear()
+            self.breakers.clear()
+
+
+class AsyncHttpClient:
+    """
+    HttpClient for coroutines, used by the ASGI mode (see asgi.py).
+
+    Calls go through one httpx.AsyncClient with the same timeouts, per-host
+    circuit breakers and on_request callback as HttpClient. Connection
+    errors are retried by the transport, and 5xx answers to idempotent
+    requests are retried with exponential backoff.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, retries=2, backoff_factor=0.5,
+                 pool_maxsize=100, failure_threshold=5, reset_timeout=30, on_request=None):
+        if httpx is None:
+            raise RuntimeError('The async HTTP client needs httpx')
+
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_request = on_request
+        self.breakers = {}
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=httpx.AsyncHTTPTransport(retries=retries, limits=httpx.Limits(max_connections=pool_maxsize)),
+        )
+
+    def breaker(self, host):
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+
+        return self.breakers[host]
+
+    async def request(self, method, url, **kwargs):
+        """
+        Sends a request through the shared async client.
+
+        Args:
+            method ([str]): [HTTP method]
+            url ([str]): [full url]
+
+        Raises:
+            CircuitOpenError: [if the host's circuit is open]
+            httpx.HTTPError: [if the request fails after its retries]
+
+        Returns:
+            [httpx.Response]: [response]
+        """
+        parts = urlsplit(url)
+        host = f'{parts.scheme}://{parts.netloc}'
+        breaker = self.breaker(host)
+
+        if not breaker.allow():
+            self.report(host, 0, 'circuit_open')
+            raise CircuitOpenError(f'Circuit open for {host}')
+
+        retries = self.retries if method.upper() in IDEMPOTENT_METHODS else 0
+        started = time.perf_counter()
+
+        for attempt in range(retries + 1):
+            try:
+                response = await self.client.request(method, url, **kwargs)
+
+            # Cancellation included, so a cancelled trial call does not leave
+            # the circuit half-open.
+            except BaseException as error:
+                breaker.record_failure()
+                self.report(host, time.perf_counter() - started, type(error).__name__)
+                raise
+
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                break
+
+            await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+
+        self.report(host, time.perf_counter() - started, response.status_code)
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+
+        else:
+            breaker.record_success()
+
+        return response
+
+    def report(self, host, seconds, outcome):
+        if self.on_request is not None:
+            self.on_request(host, seconds, outcome)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def close(self):
+        await self.client.aclose()
+        self.breakers.clear()
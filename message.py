@@ -0,0 +1,144 @@
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+def message_length(text):
+    """
+    Measures a text the way Telegram does, in UTF-16 code units.
+
+    Args:
+        text ([str]): [message text]
+
+    Returns:
+        [int]: [length]
+    """
+    return len(text.encode('utf-16-le')) // 2
+
+
+def split_text(text, limit):
+    """
+    Cuts the beginning of a text that fits a length, after a line break or
+    a space if there is one. HTML entities are never cut, and at least one
+    character is always taken, so splitting a text over and over ends.
+
+    Args:
+        text ([str]): [HTML-escaped text]
+        limit ([int]): [max length of the beginning, in UTF-16 code units]
+
+    Returns:
+        [tuple]: [beginning, rest]
+    """
+    end, length = 0, 0
+
+    while end < len(text) and length + message_length(text[end]) <= limit:
+        length += message_length(text[end])
+        end += 1
+
+    if end == len(text):
+        return text, ''
+
+    cut = max(text.rfind('\n', 0, end), text.rfind(' ', 0, end)) + 1
+
+    if cut == 0:
+        cut = end
+        entity = text.rfind('&', 0, cut)
+
+        if entity >= 0 and ';' not in text[entity:cut]:
+            cut = entity
+
+    cut = max(cut, 1)
+
+    return text[:cut], text[cut:]
+
+
+class MessageBuilder:
+    """
+    Builds a post as a list of parts and splits it into messages that fit
+    Telegram's limit.
+
+    Every message gets the header and the footer. When the next item doesn't
+    fit, a new message is started and the current section heading is
+    repeated on it. Only an item too long for a message of its own is split,
+    with split_text, over as many messages as it needs. Separators are only written between
+    blocks of the same message, so each message is formatted like a post of
+    its own.
+    """
+
+    def __init__(self, header, footer='', limit=TELEGRAM_MESSAGE_LIMIT):
+        self.header = header
+        self.footer = footer
+        self.limit = limit
+        self.messages = []
+        self.heading = None
+        self.start_message()
+
+    def start_message(self):
+        self.parts = [self.header]
+        self.length = message_length(self.header) + message_length(self.footer)
+        self.has_blocks = False
+        self.has_heading = False
+
+    def finish_message(self):
+        self.parts.append(self.footer)
+        self.messages.append(''.join(self.parts))
+
+    def section(self, heading, separator='\n'):
+        """
+        Starts a new section. Its heading is written with the first item.
+
+        Args:
+            heading ([str]): [section heading]
+            separator ([str]): [written before the heading, unless it opens the message]
+        """
+        self.heading = (heading, separator)
+        self.has_heading = False
+
+    def item(self, text, separator=''):
+        """
+        Adds an item to the current section.
+
+        Args:
+            text ([str]): [item text]
+            separator ([str]): [written before the item, unless it opens the message]
+        """
+        blocks = []
+
+        if self.heading is not None and not self.has_heading:
+            heading, heading_separator = self.heading
+            blocks.append(heading_separator + heading if self.has_blocks else heading)
+
+        lead = separator if self.has_blocks or blocks else ''
+        blocks.append(lead + text)
+        size = sum(message_length(block) for block in blocks)
+
+        if self.has_blocks and self.length + size > self.limit:
+            self.finish_message()
+            self.start_message()
+
+            return self.item(text, separator)
+
+        if self.length + size > self.limit:
+            room = self.limit - self.length - size + message_length(text)
+            beginning, rest = split_text(text, room)
+            blocks[-1] = lead + beginning
+
+            self.parts.extend(blocks)
+            self.finish_message()
+            self.start_message()
+
+            return self.item(rest, separator)
+
+        self.parts.extend(blocks)
+        self.length += size
+        self.has_blocks = True
+        self.has_heading = True
+
+    def build(self):
+        """
+        Finishes the last message.
+
+        Returns:
+            [list]: [message texts]
+        """
+        self.finish_message()
+
+        return self.messages
@@ -0,0 +1,154 @@
+import os
+import time
+
+from flask import g, request
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from urllib.parse import urlsplit
+
+
+# Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+# (set by gunicorn.conf.py) and /metrics adds them up, whichever worker
+# answers the scrape.
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ or 'prometheus_multiproc_dir' in os.environ
+
+FAST_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+
+REQUEST_SECONDS = Histogram(
+    'bgb_request_duration_seconds', 'Time spent handling requests.', ['route', 'method', 'status'])
+DB_QUERY_SECONDS = Histogram(
+    'bgb_db_query_duration_seconds', 'Time spent in SQLite queries.', ['database', 'operation'], buckets=FAST_BUCKETS)
+DB_ERRORS = Counter(
+    'bgb_db_errors_total', 'SQLite queries that raised.', ['database'])
+UPSTREAM_SECONDS = Histogram(
+    'bgb_upstream_request_duration_seconds', 'Time spent calling BGG, Comparajogos and Telegram.', ['service'])
+UPSTREAM_ERRORS = Counter(
+    'bgb_upstream_errors_total', 'Failed upstream calls, by HTTP status or error.', ['service', 'error'])
+TAGGING_SECONDS = Histogram(
+    'bgb_tagging_duration_seconds', 'Time spent generating hashtags for a post.', buckets=FAST_BUCKETS)
+RANKING_SECONDS = Histogram(
+    'bgb_ranking_duration_seconds', 'Time spent ranking /bgsearch candidates.', buckets=FAST_BUCKETS)
+SINGLEFLIGHT_CALLS = Counter(
+    'bgb_singleflight_calls_total', 'Coalesced lookups, by whether they ran, shared or timed out waiting.', ['flight', 'outcome'])
+
+
+def instrument_app(app):
+    """
+    Times every request by route, method and status.
+
+    Args:
+        app ([flask.Flask]): [application]
+    """
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop('request_started', None)
+
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            REQUEST_SECONDS.labels(route, request.method, response.status_code).observe(time.perf_counter() - started)
+
+        return response
+
+
+def instrument_engine(engine, database):
+    """
+    Times every query run through a SQLAlchemy engine.
+
+    Args:
+        engine ([sqlalchemy.engine.Engine]): [engine]
+        database ([str]): [database label]
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def observe_query(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        operation = statement.lstrip().split(None, 1)[0].lower()
+        DB_QUERY_SECONDS.labels(database, operation).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, 'handle_error')
+    def count_error(context):
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+
+        if started:
+            started.pop()
+
+        DB_ERRORS.labels(database).inc()
+
+
+def query_observer(database):
+    """
+    Builds an on_query callback for UsersRepository.
+
+    Args:
+        database ([str]): [database label]
+
+    Returns:
+        [function]: [callback receiving the operation and its duration]
+    """
+    def observe(operation, seconds):
+        DB_QUERY_SECONDS.labels(database, operation).observe(seconds)
+
+    return observe
+
+
+def upstream_observer(services):
+    """
+    Builds an on_request callback for HttpClient.
+
+    Args:
+        services ([dict]): [base url of each upstream service, by label]
+
+    Returns:
+        [function]: [callback receiving the host, the call duration and its outcome]
+    """
+    services = {'{0.scheme}://{0.netloc}'.format(urlsplit(url)): service for service, url in services.items()}
+
+    def observe(host, seconds, outcome):
+        service = services.get(host, 'other')
+        UPSTREAM_SECONDS.labels(service).observe(seconds)
+
+        if not isinstance(outcome, int) or outcome >= 400:
+            UPSTREAM_ERRORS.labels(service, str(outcome)).inc()
+
+    return observe
+
+
+def flight_observer(flight):
+    """
+    Builds an on_call callback for SingleFlight.
+
+    Args:
+        flight ([str]): [flight label]
+
+    Returns:
+        [function]: [callback receiving the outcome of a call]
+    """
+    def observe(outcome):
+        SINGLEFLIGHT_CALLS.labels(flight, outcome).inc()
+
+    return observe
+
+
+def render():
+    """
+    Renders the metrics of every worker in the Prometheus text format.
+
+    Returns:
+        [tuple]: [payload, content type]
+    """
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
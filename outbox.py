@@ -0,0 +1,239 @@
+import logging
+import sqlite3
+import threading
+import time
+
+from requests.exceptions import RequestException
+
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS outbox (
+        id              INTEGER PRIMARY KEY,
+        chat_id         TEXT NOT NULL,
+        text            TEXT NOT NULL,
+        parse_mode      TEXT,
+        status          TEXT NOT NULL DEFAULT 'pending',
+        attempts        INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        claimed_at      REAL,
+        created_at      REAL NOT NULL,
+        sent_at         REAL,
+        message_id      INTEGER,
+        last_error      TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS ix_outbox_chat_status ON outbox (chat_id, status, id)',
+    'CREATE INDEX IF NOT EXISTS ix_outbox_status ON outbox (status)',
+]
+
+# The oldest undelivered message of each chat: messages of a chat are sent
+# one at a time, in order, so a message waiting on a retry holds back the
+# ones queued after it.
+HEADS_SQL = '''SELECT id, chat_id, text, parse_mode, attempts, next_attempt_at FROM outbox AS o
+    WHERE status = 'pending' AND id = (
+        SELECT MIN(id) FROM outbox WHERE chat_id = o.chat_id AND status IN ('pending', 'sending')
+    )'''
+
+
+class Outbox:
+    """
+    Durable queue of Telegram messages with a background dispatcher.
+
+    Messages are stored in SQLite and delivered by a dispatcher thread. Each
+    chat gets at most one message every `chat_interval` seconds, and a 429
+    answer pauses the chat for its `retry_after`. Network errors and 5xx
+    answers are retried with exponential backoff, up to `max_attempts`.
+    Every gunicorn worker runs a dispatcher; messages are claimed atomically,
+    and a claim older than `lease` seconds (a worker died mid-send) is
+    released again.
+    """
+
+    def __init__(self, db_path, send_url, http, chat_interval=3.0, max_attempts=8, backoff=2.0,
+                 max_backoff=300.0, lease=60.0, poll_interval=5.0):
+        self.db_path = db_path
+        self.send_url = send_url
+        self.http = http
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+
+        con = self.connect()
+
+        for statement in OUTBOX_SCHEMA:
+            con.execute(statement)
+
+        con.commit()
+        con.close()
+
+    def connect(self):
+        con = sqlite3.connect(self.db_path, timeout=10)
+        con.execute('PRAGMA journal_mode=WAL')
+
+        return con
+
+    def enqueue(self, chat_id, texts, parse_mode='HTML'):
+        """
+        Stores messages to be sent, in order, and wakes the dispatcher up.
+
+        Args:
+            chat_id ([str]): [telegram chat or channel id]
+            texts ([list]): [message texts]
+            parse_mode ([str]): [telegram parse mode]
+
+        Returns:
+            [list]: [outbox ids]
+        """
+        now = time.time()
+        con = self.connect()
+        ids = []
+
+        for text in texts:
+            cur = con.execute(
+                'INSERT INTO outbox (chat_id, text, parse_mode, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)',
+                (str(chat_id), text, parse_mode, now, now),
+            )
+            ids.append(cur.lastrowid)
+
+        con.commit()
+        con.close()
+
+        self.wakeup.set()
+
+        return ids
+
+    def start(self):
+        """
+        Starts the dispatcher thread, once per process.
+        """
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, name='outbox-dispatcher', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                delay = self.dispatch()
+
+            except Exception:
+                logger.exception('Outbox dispatch failed')
+                delay = self.poll_interval
+
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+
+    def dispatch(self):
+        """
+        Sends every message that is due.
+
+        Returns:
+            [float]: [seconds until the next message is due]
+        """
+        con = self.connect()
+
+        try:
+            now = time.time()
+            con.execute("UPDATE outbox SET status = 'pending' WHERE status = 'sending' AND claimed_at < ?",
+                        (now - self.lease,))
+            con.commit()
+
+            delay = self.poll_interval
+
+            for row_id, chat_id, text, parse_mode, attempts, next_attempt_at in con.execute(HEADS_SQL).fetchall():
+                last_sent = con.execute("SELECT MAX(sent_at) FROM outbox WHERE chat_id = ? AND status = 'sent'",
+                                        (chat_id,)).fetchone()[0]
+                due = max(next_attempt_at, (last_sent or 0) + self.chat_interval)
+
+                if due > now:
+                    delay = min(delay, due - now)
+                    continue
+
+                claimed = con.execute("UPDATE outbox SET status = 'sending', claimed_at = ? WHERE id = ? AND status = 'pending'",
+                                      (now, row_id))
+                con.commit()
+
+                if claimed.rowcount == 1:
+                    self.deliver(con, row_id, chat_id, text, parse_mode, attempts)
+                    delay = min(delay, self.chat_interval)
+
+            return max(delay, 0)
+
+        finally:
+            con.close()
+
+    def deliver(self, con, row_id, chat_id, text, parse_mode, attempts):
+        """
+        Sends a claimed message and records the outcome.
+        """
+        payload = {'chat_id': chat_id, 'text': text}
+
+        if parse_mode:
+            payload['parse_mode'] = parse_mode
+
+        try:
+            response = self.http.post(self.send_url, json=payload)
+
+        except RequestException as error:
+            return self.retry(con, row_id, attempts + 1, str(error))
+
+        try:
+            data = response.json()
+
+        except ValueError:
+            data = {}
+
+        if response.status_code == 200 and data.get('ok'):
+            message_id = data.get('result', {}).get('message_id')
+            con.execute("UPDATE outbox SET status = 'sent', sent_at = ?, message_id = ?, attempts = ?, last_error = NULL WHERE id = ?",
+                        (time.time(), message_id, attempts + 1, row_id))
+
+        elif response.status_code == 429:
+            retry_after = data.get('parameters', {}).get('retry_after') or response.headers.get('Retry-After') or self.backoff
+            con.execute("UPDATE outbox SET status = 'pending', next_attempt_at = ?, last_error = ? WHERE id = ?",
+                        (time.time() + float(retry_after), data.get('description', 'Too Many Requests'), row_id))
+
+        elif response.status_code >= 500:
+            return self.retry(con, row_id, attempts + 1, f'HTTP {response.status_code}')
+
+        else:
+            logger.error('Telegram refused outbox message %s: %s', row_id, data.get('description', response.status_code))
+            con.execute("UPDATE outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                        (attempts + 1, data.get('description', f'HTTP {response.status_code}'), row_id))
+
+        con.commit()
+
+    def retry(self, con, row_id, attempts, error):
+        if attempts >= self.max_attempts:
+            logger.error('Giving up on outbox message %s after %s attempts: %s', row_id, attempts, error)
+            con.execute("UPDATE outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                        (attempts, error, row_id))
+
+        else:
+            delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+            con.execute("UPDATE outbox SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                        (attempts, time.time() + delay, error, row_id))
+
+        con.commit()
+
+    def counts(self):
+        """
+        Counts the messages by delivery status.
+
+        Returns:
+            [dict]: [number of messages per status]
+        """
+        con = self.connect()
+        counts = dict(con.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall())
+        con.close()
+
+        return counts
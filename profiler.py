@@ -0,0 +1,167 @@
+import glob
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from collections import Counter
+from flask import g, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+
+PROFILE_FLAG = '_profile'
+
+# Query parameters written to the profiles. The others, like the Telegram
+# login params of / (id, username, auth_date and hash), are left out, so the
+# profiles hold no credentials or user identities.
+PROFILE_QUERY_PARAMS = ('bgquery', 'q', 'state')
+
+
+def frame_name(frame):
+    code = frame.f_code
+
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """
+    Samples the stack of a thread every `interval` seconds, from a thread of
+    its own. Time the sampled thread spends waiting on the network or on
+    SQLite shows up as well as CPU time.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        """
+        Stops sampling.
+
+        Returns:
+            [Counter]: [number of samples of each stack, as a tuple of frame names from the root]
+        """
+        self.stopping.set()
+        self.thread.join()
+
+        return self.stacks
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+
+            if len(stack) > 0:
+                self.stacks[tuple(reversed(stack))] += 1
+
+
+class RequestProfiler:
+    """
+    Opt-in profiler of sampled requests.
+
+    A fraction `sample_rate` of the requests is profiled, plus any request
+    carrying a valid signed `_profile` query flag (see token()). Each
+    profile is written to `directory` in the collapsed-stack format read
+    by flamegraph.pl and speedscope, with the method, path and the
+    `query_params` of the query as the root frame. Only the newest `keep`
+    profiles are kept. Nothing is hooked into the app unless the profiler
+    is enabled.
+    """
+
+    def __init__(self, directory, secret_key=None, sample_rate=0.0, interval=0.005, keep=200, token_max_age=86_400,
+                 query_params=PROFILE_QUERY_PARAMS):
+        self.directory = directory
+        self.query_params = set(query_params)
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.keep = keep
+        self.token_max_age = token_max_age
+        self.serializer = URLSafeTimedSerializer(secret_key, salt='bgb-profiler') if secret_key else None
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self.start)
+        app.teardown_request(self.finish)
+
+    def token(self):
+        """
+        Signs a query flag value that profiles the request carrying it.
+
+        Returns:
+            [str]: [value of the _profile query parameter]
+        """
+        return self.serializer.dumps('profile')
+
+    def requested(self):
+        flag = request.args.get(PROFILE_FLAG)
+
+        if flag is None or self.serializer is None:
+            return False
+
+        try:
+            return self.serializer.loads(flag, max_age=self.token_max_age) == 'profile'
+
+        except BadSignature:
+            return False
+
+    def start(self):
+        if random.random() < self.sample_rate or self.requested():
+            g.profiler = StackSampler(threading.get_ident(), self.interval).start()
+            g.profiler_started = time.perf_counter()
+
+    def finish(self, error=None):
+        sampler = g.pop('profiler', None)
+
+        if sampler is None:
+            return
+
+        stacks = sampler.stop()
+        elapsed = time.perf_counter() - g.pop('profiler_started')
+        self.write(stacks, elapsed)
+
+    def write(self, stacks, elapsed):
+        """
+        Writes a request's samples as collapsed stacks and rotates the
+        profile directory.
+
+        Args:
+            stacks ([Counter]): [samples of each stack]
+            elapsed ([float]): [request duration in seconds]
+        """
+        query = '&'.join(f'{key}={value}' for key, value in request.args.items(multi=True) if key in self.query_params)
+        root = f'{request.method} {request.path}' + (f'?{query}' if query else '')
+        root = root.replace(';', ',').replace('\n', ' ')
+
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{int(elapsed * 1000)}ms-{slug}-{os.getpid()}-{threading.get_ident()}.collapsed'
+
+        lines = [f'{root};{";".join(stack)} {count}\n' for stack, count in stacks.items()]
+
+        with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as profile:
+            profile.writelines(lines)
+
+        with self.lock:
+            profiles = sorted(glob.glob(os.path.join(self.directory, '*.collapsed')), key=os.path.getmtime)
+
+            for old in profiles[:max(len(profiles) - self.keep, 0)]:
+                try:
+                    os.remove(old)
+
+                except OSError:
+                    pass
@@ -0,0 +1,94 @@
+import difflib
+import heapq
+
+try:
+    from rapidfuzz import fuzz, process
+
+except ImportError:
+    process = None
+
+
+def rank_difflib(candidates, query, limit=25):
+    """
+    Ranks candidates by difflib's similarity ratio to the query, keeping
+    only the best ones in a bounded heap.
+
+    The ordering is exactly the one of sorting the whole list by
+    SequenceMatcher(None, candidate, query).ratio() in reverse: ties keep
+    the candidates' original order. The query is only analysed once, and
+    candidates whose cheap upper bounds can't beat the current cut are
+    skipped before the full ratio is computed.
+
+    Args:
+        candidates ([list]): [boardgame names]
+        query ([str]): [search term]
+        limit ([int]): [number of results]
+
+    Returns:
+        [list]: [best boardgame names, best first]
+    """
+    if limit <= 0:
+        return []
+
+    matcher = difflib.SequenceMatcher(None)
+    matcher.set_seq2(query)
+    heap = []
+
+    for index, candidate in enumerate(candidates):
+        matcher.set_seq1(candidate)
+
+        if len(heap) == limit:
+            cut = heap[0][0]
+
+            if matcher.real_quick_ratio() <= cut or matcher.quick_ratio() <= cut:
+                continue
+
+            score = matcher.ratio()
+
+            if score > cut:
+                heapq.heapreplace(heap, (score, -index, candidate))
+
+        else:
+            heapq.heappush(heap, (matcher.ratio(), -index, candidate))
+
+    heap.sort(reverse=True)
+
+    return [candidate for score, index, candidate in heap]
+
+
+def rank_rapidfuzz(candidates, query, limit=25):
+    """
+    Ranks candidates with rapidfuzz's C-accelerated normalized Indel ratio.
+    It scores like difflib but is computed in bulk, so the ordering may
+    differ slightly where difflib misses the longest common subsequence.
+
+    Args:
+        candidates ([list]): [boardgame names]
+        query ([str]): [search term]
+        limit ([int]): [number of results]
+
+    Returns:
+        [list]: [best boardgame names, best first]
+    """
+    matches = process.extract(query, candidates, scorer=fuzz.ratio, processor=None, limit=limit)
+
+    return [match[0] for match in matches]
+
+
+def rank(candidates, query, limit=25, mode='difflib'):
+    """
+    Ranks the search results by similarity to the query.
+
+    Args:
+        candidates ([list]): [boardgame names]
+        query ([str]): [search term]
+        limit ([int]): [number of results]
+        mode ([str]): ['difflib' for the compatible ordering, 'fast' for rapidfuzz]
+
+    Returns:
+        [list]: [best boardgame names, best first]
+    """
+    if mode == 'fast' and process is not None:
+        return rank_rapidfuzz(candidates, query, limit)
+
+    return rank_difflib(candidates, query, limit)
@@ -0,0 +1,356 @@
+import re
+import threading
+import time
+
+from cachetools import TTLCache
+from collections import defaultdict
+
+
+# SQLite's LIKE operator only folds ASCII letters, so the index does the same
+# in order to return exactly the rows a LIKE '%term%' query would.
+ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+LIKE_WILDCARDS = ('%', '_')
+
+FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS boardgames_fts USING fts5(
+        name, content='boardgames', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS boardgames_fts_insert AFTER INSERT ON boardgames BEGIN
+        INSERT INTO boardgames_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS boardgames_fts_delete AFTER DELETE ON boardgames BEGIN
+        INSERT INTO boardgames_fts(boardgames_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS boardgames_fts_update AFTER UPDATE OF name ON boardgames BEGIN
+        INSERT INTO boardgames_fts(boardgames_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO boardgames_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+]
+
+FTS_SEARCH_SQL = 'SELECT name FROM boardgames_fts WHERE boardgames_fts MATCH :query ORDER BY rowid'
+
+
+def fold(string):
+    """
+    Folds a string the same way SQLite's LIKE does.
+
+    Args:
+        string ([str]): [original string]
+
+    Returns:
+        [str]: [ascii lowercased string]
+    """
+    return string.translate(ASCII_LOWER)
+
+
+def ngrams(string, size):
+    """
+    Lists every distinct n-gram of a given size in a string.
+
+    Args:
+        string ([str]): [folded string]
+        size ([int]): [n-gram length]
+
+    Returns:
+        [set]: [n-grams]
+    """
+    return {string[i:i + size] for i in range(len(string) - size + 1)}
+
+
+class TrigramIndex:
+    """
+    In-memory n-gram index over the boardgames catalog.
+
+    Every name is indexed by its 1, 2 and 3 character grams. Terms with up to
+    three characters are answered straight from their posting list, longer
+    terms intersect the posting lists of their trigrams (smallest first) and
+    verify the few surviving candidates, so a lookup costs time proportional
+    to the number of matches instead of the catalog size.
+
+    Each worker holds its own index, so the rows other workers insert are
+    picked up by refresh(), at most every `check_interval` seconds, calling
+    on_refresh (e.g. to clear its search cache) when it indexed new rows.
+    The catalog only grows at runtime, so only ids above the highest one
+    indexed are fetched.
+    """
+
+    def __init__(self, gram_size=3, check_interval=1.0, on_refresh=None):
+        self.gram_size = gram_size
+        self.check_interval = check_interval
+        self.on_refresh = on_refresh
+        self.rows = {}
+        self.postings = defaultdict(set)
+        self.max_id = 0
+        self.checked_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, row_id, name):
+        """
+        Indexes a catalog row.
+
+        Args:
+            row_id ([int]): [boardgames.id]
+            name ([str]): [boardgame name]
+        """
+        with self.lock:
+            self._add(row_id, name)
+
+    def _add(self, row_id, name):
+        key = fold(name)
+        self.rows[row_id] = (name, key)
+        self.max_id = max(self.max_id, row_id)
+
+        for size in range(1, self.gram_size + 1):
+            for gram in ngrams(key, size):
+                self.postings[gram].add(row_id)
+
+    def load(self, rows):
+        """
+        Indexes many catalog rows at once.
+
+        Args:
+            rows ([iterable]): [(id, name) pairs]
+        """
+        with self.lock:
+            for row_id, name in rows:
+                if name is not None:
+                    self._add(row_id, name)
+
+    def refresh(self, fetch, force=False):
+        """
+        Indexes the rows inserted since the highest id indexed.
+
+        Args:
+            fetch ([function]): [lists the (id, name) pairs of the rows with a greater id]
+            force ([bool]): [check now, even if it was checked recently]
+
+        Returns:
+            [bool]: [whether new rows were indexed]
+        """
+        with self.lock:
+            if not force and time.monotonic() - self.checked_at < self.check_interval:
+                return False
+
+            self.checked_at = time.monotonic()
+            max_id = self.max_id
+
+        rows = fetch(max_id)
+
+        if not rows:
+            return False
+
+        self.load(rows)
+
+        if self.on_refresh is not None:
+            self.on_refresh()
+
+        return True
+
+    def search(self, term):
+        """
+        Lists the names containing the term, matching SQLite's LIKE '%term%'.
+
+        Args:
+            term ([str]): [search term, without LIKE wildcards]
+
+        Returns:
+            [list]: [boardgame names, in rowid order]
+        """
+        key = fold(term)
+
+        with self.lock:
+            if len(key) == 0:
+                row_ids = self.rows.keys()
+
+            elif len(key) <= self.gram_size:
+                row_ids = self.postings.get(key, ())
+
+            else:
+                grams = sorted(ngrams(key, self.gram_size), key=lambda gram: len(self.postings.get(gram, ())))
+                candidates = set(self.postings.get(grams[0], ()))
+
+                for gram in grams[1:]:
+                    if not candidates:
+                        break
+
+                    candidates &= self.postings.get(gram, set())
+
+                row_ids = [row_id for row_id in candidates if key in self.rows[row_id][1]]
+
+            return [self.rows[row_id][0] for row_id in sorted(row_ids)]
+
+
+class SearchCache:
+    """
+    Bounded LRU cache with TTL for /bgsearch.
+
+    Ranked responses are kept per exact term, since the ranking is case
+    sensitive, and the unranked catalog matches are kept per folded term.
+    When a term extends a cached shorter one ("cat" after "ca"), its matches
+    are narrowed from the cached set instead of searching the catalog again.
+    Inserts must call clear(); other workers' caches catch up on the TTL.
+    Results computed before a clear() are discarded by passing the generation
+    read when the computation started.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, narrowing=True):
+        self.responses = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.candidates = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.narrowing = narrowing
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.narrowed = 0
+        self.misses = 0
+
+    def get_response(self, term):
+        """
+        Gets a cached ranked response.
+
+        Args:
+            term ([str]): [search term]
+
+        Returns:
+            [list or None]: [boardgame names, or None if not cached]
+        """
+        with self.lock:
+            response = self.responses.get(term)
+
+            if response is not None:
+                self.hits += 1
+
+            return response
+
+    def set_response(self, term, response, generation=None):
+        with self.lock:
+            if generation in (None, self.generation):
+                self.responses[term] = response
+
+    def get_candidates(self, term):
+        """
+        Gets the catalog matches of a term, narrowing them from the longest
+        cached prefix of the term if it wasn't cached itself.
+
+        Args:
+            term ([str]): [search term]
+
+        Returns:
+            [list or None]: [boardgame names, or None if not cached]
+        """
+        key = fold(term)
+
+        with self.lock:
+            candidates = self.candidates.get(key)
+
+            if candidates is not None:
+                self.hits += 1
+
+                return candidates
+
+            if self.narrowing and not needs_like_fallback(key):
+                for size in range(len(key) - 1, 0, -1):
+                    prefix_candidates = self.candidates.get(key[:size])
+
+                    if prefix_candidates is not None:
+                        candidates = [name for name in prefix_candidates if key in fold(name)]
+                        self.candidates[key] = candidates
+                        self.narrowed += 1
+
+                        return candidates
+
+            self.misses += 1
+
+            return None
+
+    def set_candidates(self, term, candidates, generation=None):
+        with self.lock:
+            if generation in (None, self.generation):
+                self.candidates[fold(term)] = candidates
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.responses.clear()
+            self.candidates.clear()
+
+    def stats(self):
+        """
+        Reports the cache counters.
+
+        Returns:
+            [dict]: [cache sizes and hit/miss counters]
+        """
+        with self.lock:
+            return {
+                'hits'          : self.hits,
+                'narrowed'      : self.narrowed,
+                'misses'        : self.misses,
+                'responses'     : len(self.responses),
+                'candidates'    : len(self.candidates),
+                'maxsize'       : self.responses.maxsize,
+                'ttl'           : self.responses.ttl,
+            }
+
+
+def needs_like_fallback(term):
+    """
+    Checks if a term relies on LIKE wildcards, which the index does not emulate.
+
+    Args:
+        term ([str]): [search term]
+
+    Returns:
+        [bool]: [whether the term must be sent to SQLite]
+    """
+    return any(wildcard in term for wildcard in LIKE_WILDCARDS)
+
+
+def fts_match_expression(term):
+    """
+    Turns a search term into an FTS5 query where every token is a prefix.
+
+    Args:
+        term ([str]): [search term]
+
+    Returns:
+        [str or None]: [MATCH expression, or None if the term has no tokens]
+    """
+    tokens = re.findall(r'[^\W_]+', term)
+
+    if len(tokens) == 0:
+        return None
+
+    return ' AND '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+
+def fts_exists(con):
+    """
+    Checks if the FTS5 mirror of the boardgames table exists.
+
+    Args:
+        con ([sqlite3.Connection]): [names.db connection]
+
+    Returns:
+        [bool]: [whether boardgames_fts exists]
+    """
+    query = "SELECT 1 FROM sqlite_master WHERE type='table' AND name='boardgames_fts'"
+
+    return con.execute(query).fetchone() is not None
+
+
+def rebuild_fts(con):
+    """
+    Creates the FTS5 mirror and its sync triggers, then repopulates it
+    from the boardgames table.
+
+    Args:
+        con ([sqlite3.Connection]): [names.db connection]
+    """
+    for statement in FTS_SCHEMA:
+        con.execute(statement)
+
+    con.execute("INSERT INTO boardgames_fts(boardgames_fts) VALUES ('rebuild')")
+    con.commit()
@@ -0,0 +1,149 @@
+import asyncio
+import threading
+import time
+
+
+class Call:
+    """
+    A computation in flight, shared by the callers asking for its key.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.started = time.monotonic()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent identical computations.
+
+    The first caller of a key runs the computation; callers arriving while
+    it runs wait for it and get the same result (or exception). Waiters
+    give up after `timeout` seconds and run the computation themselves, and
+    a call older than `timeout` is no longer joined, so one stuck request
+    only delays the callers that were already waiting on it.
+    """
+
+    def __init__(self, timeout=5.0, on_call=None):
+        self.timeout = timeout
+        self.on_call = on_call
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def report(self, outcome):
+        if self.on_call is not None:
+            self.on_call(outcome)
+
+    def do(self, key, function, timeout=None):
+        """
+        Runs a computation, or waits for the identical one in flight.
+
+        Args:
+            key ([hashable]): [identifies identical computations]
+            function ([function]): [computation, called without arguments]
+            timeout ([float]): [seconds to wait on the call in flight, the default timeout if none]
+
+        Returns:
+            [any]: [result of the computation]
+        """
+        timeout = self.timeout if timeout is None else timeout
+
+        with self.lock:
+            call = self.calls.get(key)
+
+            if call is None or time.monotonic() - call.started >= timeout:
+                leader = Call()
+                self.calls[key] = leader
+                call = None
+
+        if call is None:
+            self.report('leader')
+
+            return self.run(key, leader, function)
+
+        if not call.done.wait(timeout):
+            self.report('timeout')
+
+            return function()
+
+        self.report('shared')
+
+        if call.error is not None:
+            raise call.error
+
+        return call.result
+
+    def run(self, key, call, function):
+        try:
+            call.result = function()
+
+            return call.result
+
+        except Exception as error:
+            call.error = error
+            raise
+
+        finally:
+            with self.lock:
+                if self.calls.get(key) is call:
+                    del self.calls[key]
+
+            call.done.set()
+
+    def in_flight(self):
+        with self.lock:
+            return len(self.calls)
+
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    SingleFlight for coroutines on one event loop, used by the ASGI mode.
+
+    The computation runs as a task of its own, so a caller that goes away
+    (e.g. a client that disconnects) does not cancel it for the others.
+    """
+
+    async def do(self, key, function, timeout=None):
+        """
+        Awaits a computation, or the identical one in flight.
+
+        Args:
+            key ([hashable]): [identifies identical computations]
+            function ([function]): [returns the awaitable computation]
+            timeout ([float]): [seconds to wait on the call in flight, the default timeout if none]
+
+        Returns:
+            [any]: [result of the computation]
+        """
+        timeout = self.timeout if timeout is None else timeout
+        now = time.monotonic()
+        call = self.calls.get(key)
+
+        if call is None or now - call[1] >= timeout:
+            task = asyncio.ensure_future(function())
+            self.calls[key] = (task, now)
+            task.add_done_callback(lambda done: self.forget(key, done))
+            self.report('leader')
+
+            return await asyncio.shield(task)
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(call[0]), timeout)
+
+        except asyncio.TimeoutError:
+            self.report('timeout')
+
+            return await function()
+
+        self.report('shared')
+
+        return result
+
+    def forget(self, key, task):
+        if key in self.calls and self.calls[key][0] is task:
+            del self.calls[key]
+
+    def in_flight(self):
+        return len(self.calls)
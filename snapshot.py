@@ -0,0 +1,304 @@
+import array
+import bisect
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+from search import fold
+
+try:
+    import fcntl
+
+except ImportError:
+    fcntl = None
+
+
+# Layout, in native byte order:
+#   header       magic, format version, byte order, row count, max boardgames.id
+#   key_offsets  uint32[count + 1], start of each key in the keys blob
+#   name_offsets uint32[count + 1], start of each name in the names blob
+#   keys         folded names, each followed by a NUL so a term never matches
+#                across two of them
+#   names        UTF-8 names, each followed by a NUL
+# Rows are stored in rowid order, the order of LIKE results, so matches need
+# no sorting.
+MAGIC = b'BGBSNAP\x00'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('=8sHHIq')
+BYTE_ORDER = 1 if sys.byteorder == 'little' else 2
+SEPARATOR = b'\x00'
+
+# Past this many matches, splitting the whole snapshot once is cheaper than
+# locating the matches one by one.
+SCAN_THRESHOLD = 2048
+
+CATALOG_SQL = 'SELECT id, name FROM boardgames WHERE name IS NOT NULL ORDER BY id'
+CATALOG_VERSION_SQL = 'SELECT count(*), coalesce(max(id), 0) FROM boardgames WHERE name IS NOT NULL'
+
+
+def catalog_version(con):
+    """
+    Identifies the state of the catalog a snapshot was built from.
+
+    Args:
+        con ([sqlite3.Connection]): [names.db connection]
+
+    Returns:
+        [tuple]: [row count, max boardgames.id]
+    """
+    count, max_id = con.execute(CATALOG_VERSION_SQL).fetchone()
+
+    return count, max_id
+
+
+@contextmanager
+def build_lock(path):
+    """
+    Serializes the snapshot builds of every worker, so the last snapshot
+    swapped in is always built from the latest catalog. A no-op where fcntl
+    is not available.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    with open(f'{path}.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        try:
+            yield
+
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def build_snapshot(con, path):
+    """
+    Writes a snapshot of the catalog and swaps it in atomically.
+
+    Args:
+        con ([sqlite3.Connection]): [names.db connection]
+        path ([str]): [snapshot file]
+
+    Returns:
+        [tuple]: [catalog version of the snapshot]
+    """
+    with build_lock(path):
+        return write_snapshot(con, path)
+
+
+def write_snapshot(con, path):
+    rows = con.execute(CATALOG_SQL).fetchall()
+    max_id = rows[-1][0] if rows else 0
+
+    key_offsets, name_offsets = array.array('I', [0]), array.array('I', [0])
+    keys, names = bytearray(), bytearray()
+
+    for row_id, name in rows:
+        keys += fold(name).encode() + SEPARATOR
+        names += name.encode() + SEPARATOR
+        key_offsets.append(len(keys))
+        name_offsets.append(len(names))
+
+    temporary = f'{path}.{os.getpid()}.tmp'
+
+    with open(temporary, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, FORMAT_VERSION, BYTE_ORDER, len(rows), max_id))
+
+        for section in (key_offsets, name_offsets, keys, names):
+            output.write(section)
+
+    os.replace(temporary, path)
+
+    return len(rows), max_id
+
+
+class Snapshot:
+    """
+    A read-only memory map of one snapshot file. Every worker maps the same
+    pages, so lookups copy nothing but the names they return.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as snapshot:
+            self.stat = os.fstat(snapshot.fileno())
+            self.map = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, format_version, byte_order, count, max_id = HEADER.unpack_from(self.map)
+
+        if magic != MAGIC or format_version != FORMAT_VERSION or byte_order != BYTE_ORDER:
+            raise ValueError(f'{path} is not a version {FORMAT_VERSION} catalog snapshot')
+
+        self.count = count
+        self.version = (count, max_id)
+
+        view = memoryview(self.map)
+        start = HEADER.size
+        self.key_offsets = view[start:start + 4 * (count + 1)].cast('I')
+        start += 4 * (count + 1)
+        self.name_offsets = view[start:start + 4 * (count + 1)].cast('I')
+        start += 4 * (count + 1)
+        self.keys_start = start
+        self.names_start = start + self.key_offsets[count]
+
+    def name(self, index):
+        start = self.names_start + self.name_offsets[index]
+
+        return self.map[start:self.names_start + self.name_offsets[index + 1] - 1].decode()
+
+    def names(self):
+        return self.map[self.names_start:-1].decode().split('\x00') if self.count > 0 else []
+
+    def search(self, term):
+        """
+        Lists the names containing the term, matching SQLite's LIKE '%term%'.
+
+        Args:
+            term ([str]): [search term, without LIKE wildcards]
+
+        Returns:
+            [list]: [boardgame names, in rowid order]
+        """
+        key = fold(term).encode()
+
+        if SEPARATOR in key:
+            return []
+
+        if len(key) == 0:
+            return self.names()
+
+        matches = []
+        position = self.keys_start
+
+        while len(matches) < SCAN_THRESHOLD:
+            position = self.map.find(key, position, self.names_start)
+
+            if position < 0:
+                return [self.name(index) for index in matches]
+
+            index = bisect.bisect_right(self.key_offsets, position - self.keys_start) - 1
+            matches.append(index)
+            position = self.keys_start + self.key_offsets[index + 1]
+
+        return self.scan(key)
+
+    def scan(self, key):
+        keys = self.map[self.keys_start:self.names_start - 1].split(SEPARATOR)
+        names = self.names()
+
+        return [names[index] for index, row_key in enumerate(keys) if key in row_key]
+
+
+class CatalogSnapshot:
+    """
+    Catalog search backed by a memory-mapped snapshot of names.db.
+
+    The snapshot is built once and shared by every worker through the page
+    cache, so workers neither load the catalog nor hold a copy of it.
+    Rebuilds replace the file atomically; each worker checks the file at
+    most every `check_interval` seconds and maps the new one when it was
+    swapped, calling on_swap (e.g. to clear its search cache).
+    """
+
+    def __init__(self, path, check_interval=1.0, on_swap=None):
+        self.path = path
+        self.check_interval = check_interval
+        self.on_swap = on_swap
+        self.snapshot = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.current().count
+
+    def open(self, con):
+        """
+        Maps the snapshot, building it first if it is missing or older than
+        the catalog.
+
+        Args:
+            con ([sqlite3.Connection]): [names.db connection]
+        """
+        snapshot = self.load(con)
+
+        if snapshot is None:
+            # Workers booting together build it once: the others find it
+            # up to date when they get the lock.
+            with build_lock(self.path):
+                snapshot = self.load(con)
+
+                if snapshot is None:
+                    write_snapshot(con, self.path)
+                    snapshot = Snapshot(self.path)
+
+        with self.lock:
+            self.snapshot = snapshot
+            self.checked_at = time.monotonic()
+
+    def load(self, con):
+        try:
+            snapshot = Snapshot(self.path)
+
+        except (OSError, ValueError, struct.error):
+            return None
+
+        return snapshot if snapshot.version == catalog_version(con) else None
+
+    def rebuild(self, con):
+        """
+        Rebuilds the snapshot after the catalog changed and maps it.
+
+        Args:
+            con ([sqlite3.Connection]): [names.db connection]
+        """
+        build_snapshot(con, self.path)
+        self.refresh(force=True)
+
+    def refresh(self, force=False):
+        """
+        Maps the snapshot file again if it was swapped since it was mapped.
+
+        Args:
+            force ([bool]): [check now, even if it was checked recently]
+
+        Returns:
+            [bool]: [whether a new snapshot was mapped]
+        """
+        with self.lock:
+            if not force and time.monotonic() - self.checked_at < self.check_interval:
+                return False
+
+            self.checked_at = time.monotonic()
+            current = self.snapshot
+
+            try:
+                stat = os.stat(self.path)
+
+            except OSError:
+                return False
+
+            if current is not None and (stat.st_ino, stat.st_mtime_ns) == (current.stat.st_ino, current.stat.st_mtime_ns):
+                return False
+
+            try:
+                self.snapshot = Snapshot(self.path)
+
+            except (OSError, ValueError, struct.error):
+                return False
+
+        if self.on_swap is not None:
+            self.on_swap()
+
+        return True
+
+    def current(self):
+        self.refresh()
+
+        return self.snapshot
+
+    def search(self, term):
+        return self.current().search(term)
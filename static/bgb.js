@@ -234,16 +234,6 @@ function addAuctionForm() {
     $newForm.find(".remove-ac").click(removeAuctionForm);
 }
 
-function toTitleCase(string) {
-	var titleCase = string.toLowerCase().split(" ");
-
-	for (var i = 0; i < titleCase.length; i++) {
-		titleCase[i] = titleCase[i].charAt(0).toUpperCase() + titleCase[i].substring(1);
-	}
-
-	return titleCase.join(" ");
-}
-
 var boardgameLock = false
 var auctionLock = false
 var generalDetailsLock = false
@@ -288,6 +278,30 @@ function validate_boardgame(
 	}
 }
 
+// Same normalization as city_key in cities.py: the server accepts a city
+// typed without accents or in any case.
+function city_key(name) {
+	return name
+		.normalize("NFKD")
+		.replace(/\p{Mn}/gu, "")
+		.toLowerCase()
+		.split(/\s+/)
+		.filter(Boolean)
+		.join(" ")
+}
+
+function validate_city(autocomplete_list, user_input) {
+	let key = city_key(user_input)
+
+	if (key.length > 0 && autocomplete_list.some(city => city_key(city) === key)) {
+		cityLock = false
+		$("#city").removeClass("border border-danger");
+	} else {
+		cityLock = true
+		$("#city").addClass("border border-danger");
+	}
+}
+
 $(document).ready(function() {
     let whatsappRegEx = new RegExp('(zap)|(whatsapp)|(whats)|(wpp)')
 
@@ -460,41 +474,36 @@ $(document).ready(function() {
 		});
 	});
 
-	const url =
-		"https://gist.githubusercontent.com/letanure/3012978/raw/2e43be5f86eef95b915c1c804ccc86dc9790a50a/estados-cidades.json";
 	let cities = [];
 
-	fetch(url)
-		.then(function(response) {
-			return response.json();
-		})
-		.then(function(data) {
-			data.estados.forEach((element) => cities.push(element.cidades));
-			cities = [...new Set(cities.flat())];
-			cities = cities.map(function(city) {
-				return toTitleCase(city);
-			})
-		});
+	$(document).on("change", "#states", function() {
+		let city_input_element = $(this).closest("form").find(".city");
 
-	$(document).on("keypress change focus", ".city", function() {
-		var city = $(this).val()
+		if (city_input_element.val() && city_input_element.autocomplete("instance")) {
+			city_input_element.autocomplete("search");
+		}
+	});
 
-        if (cities.includes(city)) {
-            cityLock = false
-            $("#city").removeClass("border border-danger");
-        } else {
-            cityLock = true
-            $("#city").addClass("border border-danger");
-        }
+	$(document).on("keypress change focus", ".city", function() {
+		var city_input_element = $(this);
 
 		$(".city").autocomplete({
 			delay: 50,
 			source: function(request, response) {
-				typing = toTitleCase(city);
-				let results = cities.filter((word) => word.startsWith(typing)).sort(function(a, b) {
-					return a.length - b.length
-				});
-				response(results.slice(0, 20));
+				$.getJSON(
+					"/citysearch", {
+						q: request.term,
+						state: city_input_element.closest("form").find("#states").val(),
+					},
+					function(data) {
+						cities = data.cities;
+						validate_city(cities, city_input_element.val());
+						response(cities);
+					}
+				);
+			},
+			select: function(event, ui) {
+				validate_city(cities, ui.item.value);
 			},
 			minLength: 1,
 		});
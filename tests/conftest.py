@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+
+# The app's modules are top-level modules of the repository root, and the
+# local stub servers live in benchmarks/.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.stubs import StubServer
+
+
+@pytest.fixture
+def stub():
+    with StubServer() as server:
+        yield server
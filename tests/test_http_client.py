@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+import pytest
+
+from http_client import AsyncHttpClient, CircuitOpenError, HttpClient
+from requests.exceptions import ConnectionError, RequestException
+
+
+def client(**kwargs):
+    options = {'retries': 0, 'backoff_factor': 0, 'failure_threshold': 2, 'reset_timeout': 0.2}
+
+    return HttpClient(**{**options, **kwargs})
+
+
+def breaker_state(http, stub):
+    return http.breakers[stub.url].state
+
+
+def test_retries_5xx_of_idempotent_requests(stub):
+    stub.fail = True
+    http = client(retries=2, failure_threshold=10)
+
+    assert http.get(f'{stub.url}/xmlapi/search').status_code == 503
+    assert len(stub.requests) == 3
+
+    stub.requests.clear()
+
+    assert http.post(f'{stub.url}/bot/sendMessage').status_code == 503
+    assert len(stub.requests) == 1
+
+
+def test_read_timeout(stub):
+    stub.delay = 0.5
+    http = client(read_timeout=0.1)
+
+    with pytest.raises(RequestException, match='Read timed out'):
+        http.get(f'{stub.url}/xmlapi/search')
+
+    assert http.breakers[stub.url].failures == 1
+
+
+def test_connection_error_opens_circuit():
+    http = client(connect_timeout=0.5)
+    url = 'http://127.0.0.1:9/xmlapi/search'
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            http.get(url)
+
+    with pytest.raises(CircuitOpenError):
+        http.get(url)
+
+
+def test_circuit_opens_half_opens_and_closes(stub):
+    stub.fail = True
+    http = client()
+
+    for _ in range(2):
+        http.get(f'{stub.url}/xmlapi/search')
+
+    assert breaker_state(http, stub) == 'open'
+
+    with pytest.raises(CircuitOpenError):
+        http.get(f'{stub.url}/xmlapi/search')
+
+    assert len(stub.requests) == 2
+
+    time.sleep(0.25)
+    stub.fail = False
+
+    assert http.get(f'{stub.url}/xmlapi/search').status_code == 200
+    assert breaker_state(http, stub) == 'closed'
+
+
+def test_failed_trial_reopens_circuit(stub):
+    stub.fail = True
+    http = client()
+
+    for _ in range(2):
+        http.get(f'{stub.url}/xmlapi/search')
+
+    time.sleep(0.25)
+
+    assert http.get(f'{stub.url}/xmlapi/search').status_code == 503
+    assert breaker_state(http, stub) == 'open'
+
+    with pytest.raises(CircuitOpenError):
+        http.get(f'{stub.url}/xmlapi/search')
+
+
+def test_trial_failing_outside_requests_allows_another_trial(stub):
+    stub.fail = True
+    http = client()
+
+    for _ in range(2):
+        http.get(f'{stub.url}/xmlapi/search')
+
+    time.sleep(0.25)
+    stub.fail = False
+
+    def broken_hook(response, **kwargs):
+        raise ValueError('undecodable response')
+
+    with pytest.raises(ValueError):
+        http.get(f'{stub.url}/xmlapi/search', hooks={'response': broken_hook})
+
+    assert breaker_state(http, stub) == 'open'
+
+    time.sleep(0.25)
+
+    assert http.get(f'{stub.url}/xmlapi/search').status_code == 200
+    assert breaker_state(http, stub) == 'closed'
+
+
+def test_async_client_retries_and_circuit(stub):
+    async def scenario():
+        http = AsyncHttpClient(retries=2, backoff_factor=0, failure_threshold=1, reset_timeout=0.2)
+
+        try:
+            stub.fail = True
+            assert (await http.get(f'{stub.url}/xmlapi/search')).status_code == 503
+            assert len(stub.requests) == 3
+
+            with pytest.raises(CircuitOpenError):
+                await http.get(f'{stub.url}/xmlapi/search')
+
+            await asyncio.sleep(0.25)
+            stub.fail = False
+            stub.delay = 0.5
+
+            # A cancelled trial call must not leave the circuit half-open.
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(http.get(f'{stub.url}/xmlapi/search'), 0.1)
+
+            await asyncio.sleep(0.25)
+            stub.delay = 0
+
+            assert (await http.get(f'{stub.url}/xmlapi/search')).status_code == 200
+            assert http.breakers[stub.url].state == 'closed'
+
+        finally:
+            await http.close()
+
+    asyncio.run(scenario())
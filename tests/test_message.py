@@ -0,0 +1,76 @@
+import html
+
+from message import MessageBuilder, message_length, split_text
+
+
+HEADER = '<strong>Anúncios de @tester</strong>\n\n'
+FOOTER = '\n📌 #SaoPaulo #SP'
+
+
+def test_message_length_counts_utf16_units():
+    assert message_length('abc') == 3
+    assert message_length('é') == 1
+    assert message_length('🎲') == 2
+    assert message_length('↳ 🎲🎲') == 6
+
+
+def test_splits_at_item_boundaries_by_utf16_length():
+    # 40 dice are 40 characters but 80 UTF-16 units, so a limit counted in
+    # characters would fit two items per message instead of one.
+    item = '🎲' * 40 + '\n'
+    limit = message_length(HEADER + FOOTER + '💵 #VENDO\n\n') + message_length(item) + 20
+    builder = MessageBuilder(HEADER, FOOTER, limit=limit)
+    builder.section('💵 #VENDO\n\n')
+
+    for _ in range(3):
+        builder.item(item)
+
+    messages = builder.build()
+
+    assert messages == [HEADER + '💵 #VENDO\n\n' + item + FOOTER] * 3
+    assert all(message_length(message) <= limit for message in messages)
+
+
+def test_keeps_items_whole_when_they_fit():
+    builder = MessageBuilder(HEADER, FOOTER, limit=200)
+    builder.section('🤝 #TROCO\n\n')
+    items = [f'\t\t↳ #Jogo{index}\n' for index in range(20)]
+
+    for item in items:
+        builder.item(item)
+
+    messages = builder.build()
+
+    assert len(messages) > 1
+    assert ''.join(message[len(HEADER) + len('🤝 #TROCO\n\n'):-len(FOOTER)] for message in messages) == ''.join(items)
+    assert all(message_length(message) <= 200 for message in messages)
+
+
+def test_splits_an_item_longer_than_a_message():
+    details = html.escape('Caixa & manual <originais> 🎲 ' * 300, quote=False)
+    item = f'Jogo: #1 #Catan\nDetalhes: {details}\n'
+    builder = MessageBuilder(HEADER, FOOTER)
+    builder.section('💵 #VENDO\n\n')
+    builder.item(item)
+    messages = builder.build()
+
+    assert len(messages) > 1
+    assert all(message_length(message) <= 4096 for message in messages)
+    assert all(message.startswith(HEADER + '💵 #VENDO\n\n') and message.endswith(FOOTER) for message in messages)
+
+    body = ''.join(message[len(HEADER) + len('💵 #VENDO\n\n'):-len(FOOTER)] for message in messages)
+    assert body == item
+
+    # No message ends in the middle of an HTML entity.
+    for message in messages:
+        text = message[:-len(FOOTER)]
+        assert text.rfind('&') <= text.rfind(';')
+
+
+def test_split_text_never_cuts_entities_or_surrogate_pairs():
+    assert split_text('abc def', 5) == ('abc ', 'def')
+    assert split_text('abcdef', 4) == ('abcd', 'ef')
+    assert split_text('ab&amp;cd', 5) == ('ab', '&amp;cd')
+    assert split_text('a🎲b', 2) == ('a', '🎲b')
+    assert split_text('🎲', 1) == ('🎲', '')
+    assert split_text('short', 10) == ('short', '')
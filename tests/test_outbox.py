@@ -0,0 +1,157 @@
+import sqlite3
+import time
+
+import pytest
+
+from http_client import HttpClient
+from outbox import Outbox
+
+
+def make_outbox(tmp_path, stub, **kwargs):
+    http = HttpClient(retries=0, failure_threshold=100)
+    options = {'chat_interval': 0, 'backoff': 2.0, 'max_attempts': 3, 'lease': 60.0}
+
+    return Outbox(str(tmp_path / 'outbox.db'), f'{stub.url}/bottoken/sendMessage', http, **{**options, **kwargs})
+
+
+def rows(outbox):
+    con = sqlite3.connect(outbox.db_path)
+    con.row_factory = sqlite3.Row
+    result = {row['id']: dict(row) for row in con.execute('SELECT * FROM outbox')}
+    con.close()
+
+    return result
+
+
+def make_due(outbox, *ids):
+    con = sqlite3.connect(outbox.db_path)
+    con.executemany('UPDATE outbox SET next_attempt_at = 0 WHERE id = ?', [(row_id,) for row_id in ids])
+    con.commit()
+    con.close()
+
+
+def sent_texts(stub):
+    return [(message['chat_id'], message['text']) for message in stub.messages]
+
+
+def test_delivers_and_records_status(tmp_path, stub):
+    outbox = make_outbox(tmp_path, stub)
+    [row_id] = outbox.enqueue('@chat', ['<b>hello</b>'])
+
+    outbox.dispatch()
+
+    row = rows(outbox)[row_id]
+    assert (row['status'], row['attempts'], row['message_id']) == ('sent', 1, 1)
+    assert stub.messages[0]['parse_mode'] == 'HTML'
+    assert outbox.counts() == {'sent': 1}
+
+
+def test_429_waits_for_retry_after(tmp_path, stub):
+    outbox = make_outbox(tmp_path, stub)
+    stub.rate_limit_next = 1
+    [row_id] = outbox.enqueue('@chat', ['first'])
+
+    before = time.time()
+    outbox.dispatch()
+
+    row = rows(outbox)[row_id]
+    assert row['status'] == 'pending'
+    assert row['next_attempt_at'] == pytest.approx(before + 1, abs=0.5)
+    assert 'retry after' in row['last_error']
+
+    # Not due before retry_after, and the dispatcher sleeps until it is.
+    assert 0 < outbox.dispatch() <= 1
+    assert stub.messages == []
+
+    make_due(outbox, row_id)
+    outbox.dispatch()
+
+    assert rows(outbox)[row_id]['status'] == 'sent'
+
+
+def test_5xx_backs_off_exponentially_then_fails(tmp_path, stub):
+    outbox = make_outbox(tmp_path, stub)
+    stub.fail = True
+    [row_id] = outbox.enqueue('@chat', ['text'])
+
+    for attempts, backoff in [(1, 2.0), (2, 4.0)]:
+        before = time.time()
+        outbox.dispatch()
+
+        row = rows(outbox)[row_id]
+        assert (row['status'], row['attempts'], row['last_error']) == ('pending', attempts, 'HTTP 503')
+        assert row['next_attempt_at'] == pytest.approx(before + backoff, abs=0.5)
+
+        make_due(outbox, row_id)
+
+    outbox.dispatch()
+
+    assert rows(outbox)[row_id]['status'] == 'failed'
+    assert rows(outbox)[row_id]['attempts'] == 3
+
+
+def test_expired_lease_is_released(tmp_path, stub):
+    outbox = make_outbox(tmp_path, stub)
+    stale, fresh = outbox.enqueue('@stale', ['stale']) + outbox.enqueue('@fresh', ['fresh'])
+
+    # Claimed by workers that died mid-send: one lease has expired, the
+    # other may still be sending.
+    con = sqlite3.connect(outbox.db_path)
+    con.execute("UPDATE outbox SET status = 'sending', claimed_at = ? WHERE id = ?", (time.time() - 120, stale))
+    con.execute("UPDATE outbox SET status = 'sending', claimed_at = ? WHERE id = ?", (time.time(), fresh))
+    con.commit()
+    con.close()
+
+    outbox.dispatch()
+
+    assert rows(outbox)[stale]['status'] == 'sent'
+    assert rows(outbox)[fresh]['status'] == 'sending'
+    assert sent_texts(stub) == [('@stale', 'stale')]
+
+
+def test_chat_order_is_kept_across_retries(tmp_path, stub):
+    outbox = make_outbox(tmp_path, stub)
+    stub.rate_limit_next = 1
+    first, second = outbox.enqueue('@chat', ['1', '2'])
+    [other] = outbox.enqueue('@other', ['other'])
+
+    outbox.dispatch()
+
+    # The rate limited head holds back the chat's next message, not other chats.
+    assert sent_texts(stub) == [('@other', 'other')]
+    assert rows(outbox)[second]['status'] == 'pending'
+
+    make_due(outbox, first)
+    outbox.dispatch()
+    outbox.dispatch()
+
+    assert sent_texts(stub) == [('@other', 'other'), ('@chat', '1'), ('@chat', '2')]
+
+
+def test_chat_interval_paces_a_chat(tmp_path, stub):
+    outbox = make_outbox(tmp_path, stub, chat_interval=30, poll_interval=60)
+    first, second = outbox.enqueue('@chat', ['1', '2'])
+
+    outbox.dispatch()
+    delay = outbox.dispatch()
+
+    assert sent_texts(stub) == [('@chat', '1')]
+    assert 25 < delay <= 30
+    assert rows(outbox)[second]['status'] == 'pending'
+
+
+def test_dispatcher_thread_delivers_enqueued_messages(tmp_path, stub):
+    outbox = make_outbox(tmp_path, stub)
+    outbox.start()
+
+    try:
+        outbox.enqueue('@chat', ['1', '2', '3'])
+        deadline = time.monotonic() + 5
+
+        while len(stub.messages) < 3 and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+        assert sent_texts(stub) == [('@chat', '1'), ('@chat', '2'), ('@chat', '3')]
+
+    finally:
+        outbox.stop()
@@ -0,0 +1,89 @@
+import difflib
+import os
+import sqlite3
+
+import pytest
+
+from conftest import ROOT_DIR
+from ranking import rank
+
+
+QUERIES = ['a', 'ca', 'cat', 'catan', 'ticket to ride', 'pandemic legacy', 'war', 'the', 'zombicide', 'xyzzy']
+
+
+def difflib_sort(candidates, query, limit=25):
+    """
+    The ordering /bgsearch used before the top-k ranking: a stable sort of
+    every candidate by its ratio, so ties keep the catalog order.
+    """
+    return sorted(candidates, key=lambda x: difflib.SequenceMatcher(None, x, query).ratio(), reverse=True)[:limit]
+
+
+def indel_sort(candidates, query, limit=25):
+    """
+    The ordering RANKING_MODE=fast must give: a stable sort by the normalized
+    Indel similarity, twice the longest common subsequence over both lengths.
+    """
+    def similarity(name):
+        previous = [0] * (len(query) + 1)
+
+        for char in name:
+            current = [0]
+
+            for i, query_char in enumerate(query):
+                current.append(previous[i] + 1 if char == query_char else max(previous[i + 1], current[i]))
+
+            previous = current
+
+        return 2 * previous[-1] / (len(name) + len(query))
+
+    return sorted(candidates, key=similarity, reverse=True)[:limit]
+
+
+@pytest.fixture(scope='module')
+def names():
+    with sqlite3.connect(os.path.join(ROOT_DIR, 'names.db')) as con:
+        return [name for name, in con.execute('SELECT name FROM boardgames WHERE name IS NOT NULL ORDER BY id')]
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_matches_difflib_sort_of_search_results(names, query):
+    candidates = [name for name in names if query.lower() in name.lower()]
+
+    assert rank(candidates, query, mode='difflib') == difflib_sort(candidates, query)
+
+
+@pytest.mark.parametrize('query', ['Catan', 'gloomhaven', 'a'])
+def test_matches_difflib_sort_of_catalog_slice(names, query):
+    candidates = names[:3000]
+
+    assert rank(candidates, query, mode='difflib') == difflib_sort(candidates, query)
+
+
+def test_ties_keep_candidate_order():
+    # Every candidate scores the same, so the first `limit` ones must win,
+    # in order, including at the cut of the heap.
+    candidates = ['ab', 'ba', 'ab', 'ba', 'ab']
+
+    assert rank(candidates, 'ab', limit=3, mode='difflib') == difflib_sort(candidates, 'ab', limit=3)
+    assert rank(['xa', 'ax', 'bx', 'xb', 'aa'], 'ab', limit=2, mode='difflib') == ['xa', 'ax']
+
+
+def test_ties_with_duplicate_names(names):
+    candidates = [name for name in names if 'catan' in name.lower()] * 3
+
+    for limit in (1, 5, 25, len(candidates) + 1):
+        assert rank(candidates, 'catan', limit=limit, mode='difflib') == difflib_sort(candidates, 'catan', limit)
+
+
+def test_empty_and_zero_limit():
+    assert rank([], 'catan', mode='difflib') == []
+    assert rank(['Catan'], 'catan', limit=0, mode='difflib') == []
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_fast_mode_matches_indel_sort_of_search_results(names, query):
+    pytest.importorskip('rapidfuzz')
+    candidates = [name for name in names if query.lower() in name.lower()]
+
+    assert rank(candidates, query, mode='fast') == indel_sort(candidates, query)
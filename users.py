@@ -0,0 +1,241 @@
+import re
+import sqlite3
+import threading
+import time
+
+from cachetools import TTLCache
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+
+# Cooldown dates used to be stored as the text of a naive datetime in
+# Brasília time (UTC-3).
+BRASILIA_TIMEZONE = timezone(timedelta(hours=-3))
+
+USERS_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)',
+    'CREATE INDEX IF NOT EXISTS ix_users_username ON users (username)',
+]
+
+SELECT_USER_SQL = 'SELECT id, username, is_banned, block_until FROM users WHERE id = ?'
+INSERT_USER_SQL = 'INSERT INTO users (id, username, is_banned, block_until) VALUES (?, ?, 0, ?)'
+UPDATE_BLOCK_SQL = 'UPDATE users SET block_until = ? WHERE id = ?'
+UPDATE_BLOCK_BY_USERNAME_SQL = 'UPDATE users SET block_until = ? WHERE username = ?'
+
+
+def legacy_epoch(value):
+    """
+    Converts a cooldown date stored as text to epoch seconds.
+
+    Args:
+        value ([str]): [naive datetime text, in Brasília time]
+
+    Returns:
+        [int]: [epoch seconds]
+    """
+    date = datetime.fromisoformat(re.sub(r'\s+', ' ', value.strip()))
+
+    return int(date.replace(tzinfo=BRASILIA_TIMEZONE).timestamp())
+
+
+def migrate_users(con):
+    """
+    Converts the text block_until values to epoch seconds and adds the
+    indexes on users.id and users.username. Rows already converted are left
+    alone, so it can run on every startup.
+
+    Args:
+        con ([sqlite3.Connection]): [users.db connection]
+
+    Returns:
+        [int]: [number of converted rows]
+    """
+    with con:
+        for statement in USERS_INDEXES:
+            con.execute(statement)
+
+        rows = con.execute("SELECT rowid, block_until FROM users WHERE typeof(block_until) = 'text'").fetchall()
+        con.executemany('UPDATE users SET block_until = ? WHERE rowid = ?',
+                        [(legacy_epoch(block_until), rowid) for rowid, block_until in rows])
+
+    return len(rows)
+
+
+class UsersRepository:
+    """
+    Access layer for users.db.
+
+    Each thread keeps one open connection, in WAL mode so readers don't wait
+    on the writer of another gunicorn worker, with a busy timeout instead of
+    failing right away on a locked database. Statements are parameterized
+    module constants, so sqlite3's statement cache prepares each one once
+    per connection.
+
+    Banned users and users in their cooldown are cached in memory until the
+    cooldown ends, for at most `cache_ttl` seconds, so their page loads don't
+    query SQLite. Any write to users.db, through the repository or by another
+    worker (seen through SQLite's data_version), drops the cached users and
+    moves `changed_at`, which tells sessions holding a user's status that
+    they must read it again.
+    """
+
+    def __init__(self, db_path, busy_timeout=5.0, cache_size=4096, cache_ttl=300, on_query=None):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.on_query = on_query
+        self.local = threading.local()
+        self.cooldowns = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.changed_at = time.time()
+        self.lock = threading.Lock()
+
+    def connection(self):
+        con = getattr(self.local, 'con', None)
+
+        if con is None:
+            con = sqlite3.connect(self.db_path, timeout=self.busy_timeout)
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('PRAGMA synchronous=NORMAL')
+            con.execute(f'PRAGMA busy_timeout={int(self.busy_timeout * 1000)}')
+            self.local.con = con
+            self.local.data_version = con.execute('PRAGMA data_version').fetchone()[0]
+            # Writes made before this connection was opened were never seen
+            # by it.
+            self.changed()
+
+        return con
+
+    def changed(self):
+        with self.lock:
+            self.changed_at = time.time()
+            self.cooldowns.clear()
+
+    def sync(self):
+        """
+        Notices the writes other connections made to users.db since the last
+        check of this thread. data_version reads no table, so this is cheap
+        enough for every request.
+        """
+        con = self.connection()
+        data_version = con.execute('PRAGMA data_version').fetchone()[0]
+
+        if data_version != self.local.data_version:
+            self.local.data_version = data_version
+            self.changed()
+
+    def changed_since(self, checked):
+        """
+        Checks if users.db may have changed since a user was read.
+
+        Args:
+            checked ([float]): [epoch seconds of the read]
+
+        Returns:
+            [bool]: [if the user must be read again]
+        """
+        self.sync()
+
+        return self.changed_at >= checked
+
+    @contextmanager
+    def timed(self, operation):
+        """
+        Reports the duration of a query to the on_query callback.
+
+        Args:
+            operation ([str]): [repository method]
+        """
+        started = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            if self.on_query is not None:
+                self.on_query(operation, time.perf_counter() - started)
+
+    def migrate(self):
+        """
+        Runs migrate_users on users.db.
+
+        Returns:
+            [int]: [number of converted rows]
+        """
+        return migrate_users(self.connection())
+
+    def get(self, user_id):
+        """
+        Looks a user up by telegram id.
+
+        Args:
+            user_id ([int]): [telegram user id]
+
+        Returns:
+            [tuple or None]: [(id, username, is_banned, block_until) row, block_until in epoch seconds]
+        """
+        user_id = int(user_id)
+        now = time.time()
+        self.sync()
+
+        with self.lock:
+            db_user = self.cooldowns.get(user_id)
+
+        if db_user is not None and (db_user[2] == 1 or db_user[3] > now):
+            return db_user
+
+        with self.timed('get'):
+            db_user = self.connection().execute(SELECT_USER_SQL, (user_id,)).fetchone()
+
+        if db_user is not None and (db_user[2] == 1 or db_user[3] > now):
+            with self.lock:
+                self.cooldowns[user_id] = db_user
+
+        return db_user
+
+    def block(self, user_id, username, block_until):
+        """
+        Blocks a user from posting until the given time, registering them on
+        their first post.
+
+        Args:
+            user_id ([int]): [telegram user id]
+            username ([str]): [telegram username]
+            block_until ([int]): [end of the cooldown, in epoch seconds]
+        """
+        user_id = int(user_id)
+        con = self.connection()
+
+        with self.timed('block'), con:
+            if con.execute(UPDATE_BLOCK_SQL, (block_until, user_id)).rowcount == 0:
+                con.execute(INSERT_USER_SQL, (user_id, username, block_until))
+
+        self.changed()
+
+    def block_username(self, username, block_until):
+        """
+        Moves the cooldown end of a user, looked up by username.
+
+        Args:
+            username ([str]): [telegram username]
+            block_until ([int]): [end of the cooldown, in epoch seconds]
+
+        Returns:
+            [bool]: [if the user exists]
+        """
+        con = self.connection()
+
+        with self.timed('block_username'), con:
+            updated = con.execute(UPDATE_BLOCK_BY_USERNAME_SQL, (block_until, username)).rowcount > 0
+
+        self.changed()
+
+        return updated
+
+    def close(self):
+        """
+        Closes the connection of the current thread.
+        """
+        con = getattr(self.local, 'con', None)
+
+        if con is not None:
+            con.close()
+            self.local.con = None